@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Adaptive Toy MC
+
+Instead of a fixed number of samples, the function
+`run_until_precision` runs a Toy MC in batches until
+the confidence interval on the mean of the samples is
+as narrow as asked, or the time budget runs out.
+
+After every batch, the number of samples still needed
+is estimated from the standard error so far, and the
+next batch is sized to get there in one go, but no larger
+than fits in what is left of the time budget.
+"""
+
+
+import time
+
+import numpy as np
+import scipy.stats
+
+from online_stats import OnlineStats
+
+
+def run_until_precision(sample_fn, abs_err=None, rel_err=None,
+                        confidence=0.95, batch_size=10000,
+                        min_samples=1000, max_samples=100000000,
+                        time_budget=None, stats=None):
+    """
+    Runs sample_fn in batches until the half width of the
+    confidence interval on the mean of the samples is below
+    abs_err, or below rel_err times the mean.
+
+    While every sample so far is the same, the variance of integer
+    samples is taken as that of a single sample one away from the
+    rest, so that a run that has not yet seen a rare outcome, like a
+    probability estimated from only zeros, does not stop. Real
+    samples that are all the same never stop on precision.
+
+    Parameters
+    ----------
+    sample_fn : callable
+        sample_fn(n) returns an array of n samples: non-negative
+        integers, like step counts, or 0 and 1 for a probability,
+        which are also histogrammed, or any real numbers, like
+        importance weights or ratios.
+    abs_err : float, optional
+        Target absolute half width.
+    rel_err : float, optional
+        Target half width relative to the mean.
+    confidence : float
+        Confidence level of the interval.
+    batch_size : int
+        Size of the first batch, and smallest size of later ones.
+    min_samples : int
+        Never stop on precision before this many samples.
+    max_samples : int
+        Stop after this many samples.
+    time_budget : float, optional
+        Stop once this many seconds have passed. Batches are cut
+        to the time left, from the time per sample so far.
+    stats : OnlineStats, optional
+        Accumulator to add the samples to, to choose its binning
+        or to continue an earlier run. By default, one with a
+        histogram for integer samples and without for real ones.
+
+    Returns
+    -------
+    stats : OnlineStats
+        Summary of all samples, stats.n is the number used.
+    err : float
+        Achieved half width of the confidence interval.
+    """
+
+    if abs_err is None and rel_err is None:
+        raise ValueError("one of abs_err or rel_err has to be given")
+
+    z = scipy.stats.norm.ppf(0.5 + confidence / 2.0)
+    start_time = time.perf_counter()
+    n_start = 0 if stats is None else stats.n
+
+    n_batch = min(batch_size, max_samples - n_start)
+    while True:
+        samples = np.asarray(sample_fn(n_batch))
+        if stats is None:
+            integer = (np.issubdtype(samples.dtype, np.integer)
+                       or samples.dtype == bool)
+            stats = OnlineStats() if integer else OnlineStats(n_bins=None)
+        stats.update(samples)
+
+        variance = stats.variance
+        if(stats.min == stats.max):
+            variance = 1.0 / (stats.n + 1) if stats.counts is not None \
+                else np.inf
+        err = z * np.sqrt(variance / stats.n)
+
+        target = np.inf
+        if abs_err is not None:
+            target = min(target, abs_err)
+        if rel_err is not None:
+            target = min(target, rel_err * abs(stats.mean))
+
+        if stats.n >= min_samples and err <= target:
+            break
+        if stats.n >= max_samples:
+            break
+        elapsed = time.perf_counter() - start_time
+        if time_budget is not None and elapsed > time_budget:
+            break
+
+        # Samples needed go as the square of the precision.
+        if target > 0 and np.isfinite(err):
+            n_needed = stats.n * (err / target)**2 - stats.n
+        else:
+            n_needed = stats.n
+        n_batch = int(min(max(n_needed, batch_size), 10 * stats.n))
+
+        if time_budget is not None:
+            time_per_sample = elapsed / (stats.n - n_start)
+            n_left = (time_budget - elapsed) / time_per_sample
+            n_batch = int(max(min(n_batch, n_left), 1))
+        n_batch = min(n_batch, max_samples - stats.n)
+
+    return stats, err
@@ -24,23 +24,64 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 
-def random_seat(sat_spot):
+class FreeSeats:
     """
-    Random Seat helper function.
-    Returns a random seat out of available seats.
+    Free Seat helper class.
+    Keeps the open seats of a plane in a swap-remove array,
+    with a map from seat to its position in that array,
+    so taking a given seat or a random seat are both O(1).
 
     Parameters
     ----------
-    sat_spot : array_like
-        Seat map, with -1 in spots that are still open.
-
-    Returns
-    -------
-    out : int
-        Returns the index of a random available
-        spot in sat_spot.
+    n_seats : int
+        Number of seats on the plane, all open at the start.
     """
-    return np.random.choice(np.where(sat_spot == -1)[0])
+
+    def __init__(self, n_seats):
+        # The first n_free entries of free are the open seats,
+        # and position[seat] is where seat sits in free.
+        # Plain lists, since single element access is all that is needed.
+        self.free = list(range(n_seats))
+        self.position = list(range(n_seats))
+        self.n_free = n_seats
+
+    def is_free(self, seat):
+        """
+        Returns true if seat is still open.
+        """
+        return self.position[seat] < self.n_free
+
+    def take(self, seat):
+        """
+        Marks seat as taken by swapping it with the
+        last open seat and shrinking the open region.
+
+        Parameters
+        ----------
+        seat : int
+            Index of an open seat.
+        """
+        i_seat = self.position[seat]
+        last = self.free[self.n_free - 1]
+
+        self.free[i_seat] = last
+        self.position[last] = i_seat
+        self.free[self.n_free - 1] = seat
+        self.position[seat] = self.n_free - 1
+        self.n_free -= 1
+
+    def take_random(self):
+        """
+        Takes a random seat out of the available seats.
+
+        Returns
+        -------
+        out : int
+            Index of the seat that was taken.
+        """
+        seat = self.free[np.random.randint(self.n_free)]
+        self.take(seat)
+        return seat
 
 
 def board_plane(n_passengers):
@@ -72,43 +113,208 @@ def board_plane(n_passengers):
     # the seat number they should sit in.
     ticket_spot = np.arange(n_passengers)
     np.random.shuffle(ticket_spot)
+    ticket_spot = ticket_spot.tolist()
 
     # Where they actually, array of the seats and, at the end,
     # has the integer of the passenger that sat there.
     sat_spot = -1 * np.ones(n_passengers, dtype='int')  # -1 is a temp. number
+    free_seats = FreeSeats(n_passengers)
 
     # First passenger (0) sits in a random spot,
     # it could be where he was supposed to sit.
-    sat_spot[random_seat(sat_spot)] = 0
+    sat_spot[free_seats.take_random()] = 0
 
     # In order of passengers boarding,
     # check if someone is in your seat, skipping the first spot
     # and, if taken, chose a spot that isn't taken yet.
     for i in range(1, n_passengers):
-        if(sat_spot[ticket_spot[i]] == -1):
+        if(free_seats.is_free(ticket_spot[i])):
+            free_seats.take(ticket_spot[i])
             sat_spot[ticket_spot[i]] = i
         else:
-            sat_spot[random_seat(sat_spot)] = i
+            sat_spot[free_seats.take_random()] = i
 
     # Return boolean of the last passenger (n_passengers - 1) actually
     # sat in their pre-determined seat (ticket_spot[-1]).
     return sat_spot[ticket_spot[-1]] == (n_passengers - 1)
 
 
+def board_planes(n_passengers, n_trials, rng=None, chunk_size=10000,
+                 return_displaced=False):
+    """
+    Batched Boarding the Plane Toy MC
+
+    Same process as board_plane, but many planes are boarded
+    at once. The state of every plane is a column of a 2D array
+    of taken seats and the passengers board, one at a time,
+    into all of the planes in the chunk together.
+
+    Parameters
+    ----------
+    n_passengers : int
+        Number of passengers to board plane, from 2 to infty.
+    n_trials : int
+        Number of planes to board.
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
+    chunk_size : int
+        Number of planes held in memory at once.
+    return_displaced : bool
+        If true, also return the number of displaced
+        passengers on each plane.
+
+    Returns
+    -------
+    out : array
+        Boolean array of length n_trials, true where the final
+        passenger sat in their designated seat.
+    n_displaced : array
+        Only if return_displaced. Number of passengers, not counting
+        the first, that found someone in their seat.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    last_had_seat = np.zeros(n_trials, dtype=bool)
+    n_displaced = np.zeros(n_trials, dtype=int)
+    for start in range(0, n_trials, chunk_size):
+        n_planes = min(chunk_size, n_trials - start)
+        planes = np.arange(n_planes)
+
+        # Seats are labelled by the passenger that holds the ticket for them.
+        # This is only a relabelling of the shuffled tickets in board_plane,
+        # so passenger i's seat is row i of the state array,
+        # which holds one column per plane.
+        taken = np.zeros((n_passengers, n_planes), dtype=bool)
+
+        # First passenger sits in a random spot on every plane.
+        taken[rng.integers(n_passengers, size=n_planes), planes] = True
+
+        for i in range(1, n_passengers - 1):
+            displaced = taken[i].copy()
+            taken[i] = True
+            n_displaced[start:start + n_planes] += displaced
+
+            # Seats 1 to i are always taken by the time passenger i boards,
+            # and seat 0 and the seats of those still in line are always
+            # free when passenger i is displaced, so one draw suffices.
+            cols = planes[displaced]
+            seat = rng.integers(i, n_passengers, size=len(cols))
+            seat[seat == i] = 0
+            taken[seat, cols] = True
+
+        # The final passenger gets their seat if it is still open.
+        last_had_seat[start:start + n_planes] = ~taken[-1]
+        n_displaced[start:start + n_planes] += taken[-1]
+
+    if return_displaced:
+        return last_had_seat, n_displaced
+    return last_had_seat
+
+
+def displaced_probabilities(n_passengers):
+    """
+    Exact probability that each passenger is displaced.
+
+    Passenger i > 0 finds someone in their seat if the first
+    passenger, or a displaced passenger j < i, sat there.
+    Out of the n - j seats open to a displaced passenger j,
+    one is the seat of the first passenger, which ends the chain,
+    and one is seat i, giving the recursion
+    P(i) = 1/n + sum_{0 < j < i} P(j) / (n - j),
+    which is solved by P(i) = 1 / (n - i + 1).
+
+    Parameters
+    ----------
+    n_passengers : int
+        Number of passengers to board plane, from 2 to infty.
+
+    Returns
+    -------
+    out : array
+        Probability that passenger i did not sit in their
+        designated seat. Entry 0 is the first passenger,
+        who only sits in their seat by chance.
+    """
+
+    i = np.arange(n_passengers)
+    prob = 1.0 / (n_passengers - i + 1.0)
+    prob[0] = 1.0 - 1.0 / n_passengers
+    return prob
+
+
+def displaced_count_pmf(n_passengers, tol=1e-16):
+    """
+    Exact probability mass function of the number of
+    displaced passengers, not counting the first.
+
+    The chain above only depends on the seat of the last displaced
+    passenger, so passenger i is displaced independently of the
+    others, with probability 1/m for m = n - i + 1 = 2, ..., n.
+    With P_m(d) the probability of d displaced passengers
+    out of the first m terms,
+    m P_m(d) = (m - 1) P_{m-1}(d) + P_{m-1}(d - 1),
+    so P_m(d) = (1/m) sum_{j<m} P_j(d - 1) and each d is a
+    cumulative sum over m, or O(n) work.
+
+    Parameters
+    ----------
+    n_passengers : int
+        Number of passengers to board plane, from 2 to infty.
+    tol : float
+        The PMF is truncated after its mode,
+        once a term falls below tol.
+
+    Returns
+    -------
+    out : array
+        Probability that d passengers were displaced,
+        for d = 0, 1, ...
+    """
+
+    m = np.arange(1, n_passengers + 1, dtype=float)
+
+    # The mean number displaced is H_n - 1.
+    mean = np.sum(1.0 / m) - 1.0
+
+    p_m = 1.0 / m
+    pmf = [p_m[-1]]
+    for d in range(1, n_passengers):
+        p_m[1:] = np.cumsum(p_m[:-1]) / m[1:]
+        p_m[0] = 0.0
+        pmf.append(p_m[-1])
+        if(d > mean and pmf[-1] < tol):
+            break
+
+    return np.array(pmf)
+
+
 if(__name__ == "__main__"):
-    # Number of toy MC tests, or 1000 boardings.
-    n_throws = 10000
+    # Number of toy MC tests, or boardings per plane size.
+    n_throws = 1000000
 
     n_passengers = np.arange(2, 103, 10)
 
-    # Vectorize the process to speed it up a bit.
-    vfunc_board_plane = np.vectorize(board_plane)
+    rng = np.random.default_rng()
 
     last_had_seat = np.zeros(len(n_passengers))
+    last_had_seat_exact = np.zeros(len(n_passengers))
 
     for i, n_passengers_ in enumerate(n_passengers):
-        last_had_seat_ = vfunc_board_plane(n_passengers_ * np.ones(n_throws, dtype='int'))
+        last_had_seat_, n_displaced = board_planes(n_passengers_, n_throws, rng,
+                                                   return_displaced=True)
         last_had_seat[i] = np.sum(last_had_seat_)
+        last_had_seat_exact[i] = 1.0 - displaced_probabilities(n_passengers_)[-1]
+
+    # Cross-check the number of displaced passengers on the largest plane.
+    pmf_exact = displaced_count_pmf(n_passengers[-1])
+    pmf_mc = np.bincount(n_displaced, minlength=len(pmf_exact)) / n_throws
+    print("Displaced \t Numerical \t Analytical")
+    for d in range(len(pmf_exact)):
+        if(pmf_exact[d] * n_throws < 1.0):
+            break
+        print("%d \t\t %f \t %f" % (d, pmf_mc[d], pmf_exact[d]))
 
     last_had_seat_prob = last_had_seat / n_throws
     # Approximate binomial errors using sqrt(counts)
@@ -124,10 +330,11 @@ if(__name__ == "__main__"):
                  fmt=' ', color='black',
                  label="Numerical Result")
 
-    plt.axhline(0.5,
-                color='red',
-                linestyle='--',
-                label="Analytical Result")
+    plt.plot(n_passengers,
+             last_had_seat_exact,
+             color='red',
+             linestyle='--',
+             label="Analytical Result")
 
     plt.xlabel("Number of Passengers Boarding Plane")
     plt.ylabel("Probability Last Passengers had Their Ticketed Seat")
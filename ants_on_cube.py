@@ -15,13 +15,21 @@ edges that it walks before reaching the opposite
 edge of the cube from its starting point?
 
 This is easily answered using a Toy MC.
-The analytical answer is 10 edges.
+The analytical answer is 10 edges, which is checked
+by treating the end vertex as an absorbing state
+of the Markov chain.
 """
 
 
 import numpy as np
+import scipy.linalg
+import scipy.sparse as sp
+import scipy.sparse.linalg
 import matplotlib.pyplot as plt
 
+from adaptive_mc import run_until_precision
+from online_stats import OnlineStats
+
 
 def walk_edges(probability_matrix, end_vertex=1, start_vertex=1):
     """
@@ -61,6 +69,380 @@ def walk_edges(probability_matrix, end_vertex=1, start_vertex=1):
             return n_steps
 
 
+def walk_edges_batch(probability_matrix, n_walkers,
+                     end_vertex=1, start_vertex=1, rng=None):
+    """
+    Walk many ants around the edges of a cube at once.
+    Same walk as walk_edges, but all ants take their
+    steps together and ants that reach the end vertex
+    are dropped from the walk.
+
+    Each step is drawn from a precomputed table of the
+    cumulative transition probabilities of every vertex,
+    over the vertices it can step to, with the table of
+    vertex i shifted up by i, so a single searchsorted
+    call steps all of the ants.
+
+    Parameters
+    ----------
+    probability_matrix : array-like or sparse matrix
+        Transition matrix at each vertex.
+    n_walkers : int
+        Number of ants to walk.
+    start_vertex : int
+        Vertex number of first vertex.
+    end_vertex : int
+        Vertex number of last vertex.
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
+
+    Returns
+    -------
+    out : array
+        Number of edges traversed between the
+        start and end vertices, one entry per ant.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    # Column i of probability_matrix is the transition out of vertex i,
+    # stored as the non-zero entries of each column.
+    transitions = sp.csc_matrix(probability_matrix, dtype=float)
+    transitions.eliminate_zeros()
+    transitions.sort_indices()
+    col_lengths = np.diff(transitions.indptr)
+
+    cdf = np.cumsum(transitions.data)
+    col_start = np.concatenate([[0.0], cdf])[transitions.indptr[:-1]]
+    cdf -= np.repeat(col_start, col_lengths)
+    cdf[transitions.indptr[1:][col_lengths > 0] - 1] = 1.0
+    cdf += np.repeat(np.arange(transitions.shape[1]), col_lengths)
+
+    # Vertices counted from 0 in here.
+    cur_vertex = np.full(n_walkers, start_vertex - 1)
+    walker = np.arange(n_walkers)
+    results = np.zeros(n_walkers, dtype=int)
+
+    n_steps = 0
+    while len(walker) > 0:
+        target = cur_vertex + rng.random(len(walker))
+        # cur_vertex + u can round up to cur_vertex + 1, which would
+        # land in the table of the next vertex, so stop at the last
+        # vertex that can be stepped to.
+        pos = np.minimum(np.searchsorted(cdf, target, side='right'),
+                         transitions.indptr[cur_vertex + 1] - 1)
+        cur_vertex = transitions.indices[pos]
+        n_steps += 1
+
+        arrived = cur_vertex == end_vertex - 1
+        results[walker[arrived]] = n_steps
+        walker = walker[~arrived]
+        cur_vertex = cur_vertex[~arrived]
+
+    return results
+
+
+def hitting_time(probability_matrix, end_vertex=1, start_vertex=1,
+                 max_steps=100):
+    """
+    Exact distribution of the number of edges walked by walk_edges.
+    The end vertex is made absorbing and the expected time to
+    absorption t from every other vertex solves the linear system
+    (I - Q^T) t = 1, with Q the transition matrix between the
+    non-absorbing vertices. The second moment s solves
+    (I - Q^T) s = 1 + 2 Q^T t. The PMF is found by pushing the
+    probability of the ant being at each vertex forward one
+    step at a time and collecting what reaches the end vertex,
+    see hitting_time_pmf.
+
+    The linear solves lose all precision once the mean is beyond
+    ~1e15, use birth_death_hitting_time for long walks on a chain.
+
+    Parameters
+    ----------
+    probability_matrix : array-like or sparse matrix
+        Transition matrix at each vertex, as in walk_edges.
+        Sparse matrices are solved with sparse LU.
+    start_vertex : int
+        Vertex number of first vertex.
+    end_vertex : int
+        Vertex number of last vertex.
+    max_steps : int
+        Number of steps to compute the PMF for.
+
+    Returns
+    -------
+    mean : float
+        Expectation value of the number of edges walked.
+    variance : float
+        Variance of the number of edges walked.
+    pmf : array
+        Probability that the walk took n edges,
+        for n = 0, ..., max_steps.
+    """
+
+    n_vertices = probability_matrix.shape[0]
+    end = end_vertex - 1
+    start = start_vertex - 1
+    transient = np.arange(n_vertices) != end
+
+    if sp.issparse(probability_matrix):
+        probability_matrix = sp.csr_matrix(probability_matrix)
+        q_t = sp.csr_matrix(probability_matrix.T)[transient][:, transient]
+        solve = scipy.sparse.linalg.factorized(
+            (sp.identity(n_vertices - 1) - q_t).tocsc())
+        first_step = probability_matrix[:, start].toarray().ravel()
+    else:
+        probability_matrix = np.asarray(probability_matrix, dtype=float)
+        q_t = probability_matrix.T[transient][:, transient]
+        lu = scipy.linalg.lu_factor(np.identity(n_vertices - 1) - q_t)
+        solve = lambda b: scipy.linalg.lu_solve(lu, b)
+        first_step = probability_matrix[:, start]
+
+    # Mean and second moment of the time to the end vertex,
+    # from every vertex but the end vertex.
+    t = solve(np.ones(n_vertices - 1))
+    s = solve(1.0 + 2.0 * (q_t @ t))
+
+    # Every walk takes a first step, even if it starts on the end vertex.
+    first_step = first_step[transient]
+    mean = 1.0 + first_step @ t
+    second_moment = 1.0 + 2.0 * (first_step @ t) + first_step @ s
+    variance = second_moment - mean**2
+
+    pmf = hitting_time_pmf(probability_matrix, end_vertex=end_vertex,
+                           start_vertex=start_vertex, max_steps=max_steps)
+
+    return mean, variance, pmf
+
+
+def hitting_time_pmf(probability_matrix, end_vertex=1, start_vertex=1,
+                     max_steps=100):
+    """
+    PMF of the number of edges walked by walk_edges, found by
+    pushing the probability of the ant being at each vertex forward
+    one step at a time and collecting what reaches the end vertex.
+
+    Parameters
+    ----------
+    probability_matrix : array-like or sparse matrix
+        Transition matrix at each vertex, as in walk_edges.
+    start_vertex : int
+        Vertex number of first vertex.
+    end_vertex : int
+        Vertex number of last vertex.
+    max_steps : int
+        Number of steps to compute the PMF for.
+
+    Returns
+    -------
+    out : array
+        Probability that the walk took n edges,
+        for n = 0, ..., max_steps.
+    """
+
+    if sp.issparse(probability_matrix):
+        probability_matrix = sp.csr_matrix(probability_matrix)
+
+    pmf = np.zeros(max_steps + 1)
+    cur_vector = np.zeros(probability_matrix.shape[0])
+    cur_vector[start_vertex - 1] = 1.0
+    for n_steps in range(1, max_steps + 1):
+        cur_vector = probability_matrix @ cur_vector
+        pmf[n_steps] = cur_vector[end_vertex - 1]
+        cur_vector[end_vertex - 1] = 0.0
+
+    return pmf
+
+
+def birth_death_hitting_time(probability_matrix, end_vertex, start_vertex=1,
+                             max_steps=100):
+    """
+    Exact distribution of the number of edges walked by walk_edges
+    on a chain where vertex k only steps to k - 1, k or k + 1,
+    such as a lumped hypercube, walking up from start_vertex.
+
+    The walk has to pass through every vertex between the start and
+    end vertices, so the time is a sum of independent times tau_k to
+    go from k to k + 1. With u, r and d the probabilities to go
+    up, stay and go down from k, their means and variances follow
+    e_k = (1 + d e_{k-1}) / u,
+    v_k = (d v_{k-1} + W_k) / u,
+    with W_k the variance of the extra time after the first step.
+    All terms are positive, so unlike the linear solves in
+    hitting_time there is no loss of precision for long walks.
+    The variance does overflow, silently, to inf once the mean
+    is beyond ~1e154, as for hypercubes of dimension above ~520.
+
+    Parameters
+    ----------
+    probability_matrix : array-like or sparse matrix
+        Tridiagonal transition matrix at each vertex,
+        as in walk_edges.
+    end_vertex : int
+        Vertex number of last vertex.
+    start_vertex : int
+        Vertex number of first vertex, below end_vertex.
+    max_steps : int
+        Number of steps to compute the PMF for.
+
+    Returns
+    -------
+    mean : float
+        Expectation value of the number of edges walked.
+    variance : float
+        Variance of the number of edges walked.
+    pmf : array
+        Probability that the walk took n edges,
+        for n = 0, ..., max_steps.
+    """
+
+    if(start_vertex >= end_vertex):
+        raise ValueError("start_vertex has to be below end_vertex")
+
+    if sp.issparse(probability_matrix):
+        diagonals = sp.dia_matrix(probability_matrix)
+        p_up = diagonals.diagonal(-1)
+        p_stay = diagonals.diagonal(0)
+        p_down = diagonals.diagonal(1)
+    else:
+        p_up = np.diagonal(probability_matrix, -1)
+        p_stay = np.diagonal(probability_matrix, 0)
+        p_down = np.diagonal(probability_matrix, 1)
+
+    mean, variance = 0.0, 0.0
+    e_k, v_k = 0.0, 0.0
+    for k in range(end_vertex - 1):
+        u = p_up[k]
+        r = p_stay[k]
+        d = p_down[k - 1] if k > 0 else 0.0
+
+        # Extra time after the first step is 0, e_k or e_{k-1} + e_k,
+        # in units of e_k, so only the final square can overflow.
+        e_below, v_below = e_k, v_k
+        e_k = (1.0 + d * e_below) / u
+        extra = np.array([0.0, 1.0, e_below / e_k + 1.0])
+        p_extra = np.array([u, r, d])
+        extra, p_extra = extra[p_extra > 0], p_extra[p_extra > 0]
+        extra_mean = np.sum(p_extra * extra)
+        with np.errstate(over='ignore'):
+            w_k = e_k**2 * np.sum(p_extra * np.square(extra - extra_mean))
+        v_k = (d * v_below + w_k) / u
+
+        if(k >= start_vertex - 1):
+            mean += e_k
+            variance += v_k
+
+    pmf = hitting_time_pmf(probability_matrix, end_vertex=end_vertex,
+                           start_vertex=start_vertex, max_steps=max_steps)
+
+    return mean, variance, pmf
+
+
+def lump_probability_matrix(probability_matrix, partition):
+    """
+    Reduce a transition matrix to a chain between groups of vertices.
+    The vertices in a group have to be interchangeable, i.e. every
+    vertex of a group has the same probability of stepping into
+    each group, as for vertices at the same distance from the start
+    on a regular graph, or orbits of an automorphism of the graph.
+
+    Parameters
+    ----------
+    probability_matrix : array-like or sparse matrix
+        Transition matrix at each vertex, as in walk_edges.
+    partition : array_like
+        Group number, from 0, of each vertex.
+
+    Returns
+    -------
+    out : array or sparse matrix
+        Transition matrix between the groups, in the same layout
+        as probability_matrix, so group g is vertex number g + 1.
+    """
+
+    partition = np.asarray(partition)
+    n_vertices = probability_matrix.shape[0]
+    n_groups = np.max(partition) + 1
+
+    indicator = sp.csr_matrix((np.ones(n_vertices),
+                               (np.arange(n_vertices), partition)),
+                              shape=(n_vertices, n_groups))
+
+    # Probability of stepping from each vertex into each group.
+    group_transition = indicator.T @ probability_matrix
+    if sp.issparse(group_transition):
+        group_transition = group_transition.toarray()
+    group_transition = np.asarray(group_transition)
+
+    first_vertex = np.zeros(n_groups, dtype=int)
+    first_vertex[partition[::-1]] = np.arange(n_vertices)[::-1]
+    lumped_matrix = group_transition[:, first_vertex]
+
+    if not np.allclose(group_transition, lumped_matrix[:, partition]):
+        raise ValueError("partition is not lumpable, vertices in a group "
+                         "have different transitions between groups")
+
+    if sp.issparse(probability_matrix):
+        return sp.csr_matrix(lumped_matrix)
+    return lumped_matrix
+
+
+def hamming_partition(dim, start_vertex=1):
+    """
+    Group the vertices of a dim-dimensional hypercube by their
+    Hamming distance from the start vertex. Vertex number v is the
+    corner whose coordinates are the bits of v - 1.
+
+    Parameters
+    ----------
+    dim : int
+        Dimension of the hypercube.
+    start_vertex : int
+        Vertex number of first vertex.
+
+    Returns
+    -------
+    out : array
+        Distance from start_vertex of each of the 2^dim vertices.
+    """
+
+    corner = np.arange(2**dim) ^ (start_vertex - 1)
+    bits = (corner[:, None] >> np.arange(dim)) & 1
+    return np.sum(bits, axis=1)
+
+
+def hypercube_lumped_matrix(dim):
+    """
+    Transition matrix of a walk on the corners of a dim-dimensional
+    hypercube, lumped by Hamming distance from the start.
+    From distance k, the ant steps to k - 1 with probability k / dim
+    and to k + 1 otherwise. Built directly on the dim + 1 distances,
+    without the 2^dim corners, so vertex number k + 1 is distance k
+    and the opposite corner is vertex number dim + 1.
+
+    Parameters
+    ----------
+    dim : int
+        Dimension of the hypercube.
+
+    Returns
+    -------
+    out : sparse matrix
+        (dim + 1) x (dim + 1) transition matrix, in the same layout
+        as probability_matrix in walk_edges. Its hitting times are
+        found with birth_death_hitting_time.
+    """
+
+    k = np.arange(dim + 1)
+    p_down = k / dim
+    return sp.csr_matrix((np.concatenate([p_down[1:], 1.0 - p_down[:-1]]),
+                          (np.concatenate([k[:-1], k[1:]]),
+                           np.concatenate([k[1:], k[:-1]]))),
+                         shape=(dim + 1, dim + 1))
+
+
 if __name__ == "__main__":
 
     probability_matrix = np.array([[0, 1, 0, 1, 0, 1, 0, 0],
@@ -74,27 +456,40 @@ if __name__ == "__main__":
                                   dtype='float')
     probability_matrix *= (1/3)
 
-    # Number of Toy MC iterations.
-    n_throws = 100000
-
     start_vertex = 1
     end_vertex = 8
 
-    vfunc_walk_edges = np.vectorize(walk_edges,
-                                    excluded=['probability_matrix'])
+    def sample_walks(n_throws):
+        return walk_edges_batch(probability_matrix, n_throws,
+                                end_vertex=end_vertex,
+                                start_vertex=start_vertex)
 
-    results = vfunc_walk_edges(probability_matrix=probability_matrix,
-                               end_vertex=end_vertex * np.ones(n_throws, dtype='int'),
-                               start_vertex=start_vertex * np.ones(n_throws, dtype='int'))
+    # Walk until the mean is known to 0.5%, at 95% confidence.
+    stats, err = run_until_precision(sample_walks, rel_err=0.005,
+                                     stats=OnlineStats(n_bins=1000))
+    print("Mean of %d walks: %.3f +- %.3f steps" % (stats.n, stats.mean, err))
 
-    num_exp_value = np.mean(results)
-    ana_exp_value = 10.0
+    num_exp_value = stats.mean
+    ana_exp_value, ana_variance, ana_pmf = hitting_time(probability_matrix,
+                                                        end_vertex=end_vertex,
+                                                        start_vertex=start_vertex,
+                                                        max_steps=101)
 
-    plt.hist(results,
+    plt.hist(np.arange(stats.n_bins),
+             weights=stats.counts[:-1],
              range=(3, 101),
              bins=49,
              density=True,
              log=True)
+    plt.hist(np.arange(len(ana_pmf)),
+             weights=ana_pmf,
+             range=(3, 101),
+             bins=49,
+             density=True,
+             log=True,
+             histtype='step',
+             color='red',
+             label="Analytical PMF")
     plt.axvline(num_exp_value,
                 label="Numerical Expectation Value: %.2f" % num_exp_value,
                 color='black')
@@ -8,7 +8,8 @@ and create a transition matrix to generate
 Jane Austen-like writing.
 
 The transition matrix gives the probability that
-a word follows a given word.
+a word follows a given word, or a given sequence of
+words for a higher order chain.
 
 To generate sentences, I use the transition matrix,
 a random number generator, and a starter word to
@@ -16,14 +17,95 @@ generate text that is similar to the 'training' set.
 """
 
 
+import os
+import re
+import sys
+from multiprocessing import Pool
+
 import numpy as np
-from nltk.corpus import gutenberg
+import scipy.sparse as sp
+
+
+# Same split into words and punctuation as NLTK's WordPunctTokenizer,
+# which the gutenberg corpus reader uses.
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]+")
+
+# Words printed without a space in front of them.
+PUNCTUATION = [".", ",", ")", "(", "?", "!", ":", "'", ";"]
+
+# Version of the files written by save_model. Models saved by another
+# version, or by older code without one, are refused by load_model.
+MODEL_FORMAT = 2
+
+
+class Vocabulary:
+    """
+    Vocabulary of a trained chain, to turn indices back into text.
+    Each word is stored once with the space that goes in front of it,
+    so rendering a sentence is a lookup and a join.
+
+    Parameters
+    ----------
+    unique_words : array
+        The vocabulary, np.unique(text).
+    punct : list of str
+        Words printed without a space in front of them.
+    """
+
+    def __init__(self, unique_words, punct=PUNCTUATION):
+        self.words = np.asarray(unique_words)
+        self.is_punct = np.isin(self.words, punct)
+        self.tokens = np.array([word if is_punct else " " + word
+                                for word, is_punct in zip(self.words.tolist(),
+                                                          self.is_punct)],
+                               dtype=object)
+
+    def __len__(self):
+        return len(self.words)
+
+    def render(self, sentence_maps):
+        """
+        Translate indices to text.
+
+        Parameters
+        ----------
+        sentence_maps : array
+            Array of indices of one sentence, or of shape
+            (n_sentences, n_words) for many sentences.
+
+        Returns
+        -------
+        out : str or list of str
+            The text of each sentence.
+        """
+
+        sentence_maps = np.asarray(sentence_maps)
+        if(sentence_maps.ndim == 1):
+            return "".join(self.tokens[sentence_maps])
+        return ["".join(tokens) for tokens in self.tokens[sentence_maps]]
+
+    def write(self, sentence_maps, stream=None):
+        """
+        Write sentences to a stream, one per line, in one write call.
+
+        Parameters
+        ----------
+        sentence_maps : array
+            Array of shape (n_sentences, n_words) of indices.
+        stream : file-like, optional
+            Where to write the text, sys.stdout if None.
+        """
+
+        if stream is None:
+            stream = sys.stdout
+        stream.write("\n".join(self.render(np.atleast_2d(sentence_maps))) + "\n")
 
 
 def create_prob_matrix(text):
     """
     Calculate the transition matrix given text.
-    Not optimized, but good enough for this data set.
+    Only the bigrams that occur in the text are stored,
+    in a sparse matrix with one row per unique word.
 
     Parameters
     ----------
@@ -32,41 +114,421 @@ def create_prob_matrix(text):
 
     Returns
     -------
-    prob_matrix : array
-        The transition matrix
+    prob_matrix : scipy.sparse.csr_matrix
+        The transition matrix. Row i holds the probability of each
+        word following the i-th word of np.unique(text).
     """
 
-    unique_words = np.unique(text)
+    unique_words, index_map = np.unique(text, return_inverse=True)
 
-    index_map = np.zeros(len(text), dtype='int')
-    for i_unique_word, unique_word in enumerate(unique_words):
-        index_map[text == unique_word] = i_unique_word
+    return count_transitions(index_map[:-1], index_map[1:],
+                             len(unique_words), len(unique_words))
 
-    prob_matrix = np.zeros((len(unique_words), len(unique_words)))
-    for i_word in range(len(text)-1):
-        prob_matrix[index_map[i_word], index_map[i_word+1]] += 1
 
-    for i_unique_word, unique_word in enumerate(unique_words):
-        sum_ = np.sum(prob_matrix[i_unique_word])
-        if(sum_ != 0):
-            prob_matrix[i_unique_word] /= sum_
+def count_transitions(rows, cols, n_rows, n_cols, counts=None):
+    """
+    Count each (row, col) pair and normalize the counts
+    of each row into a sparse transition matrix.
+
+    Parameters
+    ----------
+    rows : array
+        Index of the word, or words, each transition starts from.
+    cols : array
+        Index of the word that follows.
+    n_rows : int
+        Number of rows of the transition matrix.
+    n_cols : int
+        Number of columns of the transition matrix.
+    counts : array, optional
+        Number of times each pair was seen, if the pairs
+        have already been counted.
+
+    Returns
+    -------
+    prob_matrix : scipy.sparse.csr_matrix
+        The transition matrix.
+    """
+
+    # Count each pair once, keyed by its (row, col) index.
+    pairs = np.asarray(rows, dtype=np.int64) * n_cols + cols
+    if counts is None:
+        pairs, counts = np.unique(pairs, return_counts=True)
+    else:
+        pairs, inverse = np.unique(pairs, return_inverse=True)
+        counts = np.bincount(inverse, weights=counts)
+
+    prob_matrix = sp.csr_matrix((counts.astype(float),
+                                 (pairs // n_cols, pairs % n_cols)),
+                                shape=(n_rows, n_cols))
+
+    # Normalize each row, words without a follower keep an empty row.
+    sums = np.asarray(prob_matrix.sum(axis=1)).ravel()
+    prob_matrix.data /= np.repeat(sums, np.diff(prob_matrix.indptr))
 
     return prob_matrix
 
 
-def generate_sentence_map(prob_matrix, start_pt=0, n_words=100):
+def pack_contexts(contexts, n_words):
+    """
+    Pack sequences of word indices into single integer keys.
+    Each word takes ceil(log2(n_words)) bits, the first word in
+    the highest bits, so keys sort like the sequences they hold.
+
+    Parameters
+    ----------
+    contexts : array
+        Array of shape (n, order) of word indices.
+    n_words : int
+        Number of unique words.
+
+    Returns
+    -------
+    out : array
+        uint64 array of n keys.
+    """
+
+    contexts = np.asarray(contexts, dtype=np.uint64)
+    order = contexts.shape[1]
+    n_bits = max(1, int(np.ceil(np.log2(n_words))))
+    if(order * n_bits > 64):
+        raise ValueError("order %d contexts of %d words do not fit in 64 bits"
+                         % (order, n_words))
+
+    shifts = n_bits * np.arange(order - 1, -1, -1, dtype=np.uint64)
+    return np.bitwise_or.reduce(contexts << shifts, axis=1)
+
+
+def unpack_contexts(keys, order, n_words):
+    """
+    Unpack keys from pack_contexts back into sequences of word indices.
+
+    Parameters
+    ----------
+    keys : array
+        uint64 keys, from pack_contexts.
+    order : int
+        Number of words in each key.
+    n_words : int
+        Number of unique words, as given to pack_contexts.
+
+    Returns
+    -------
+    out : array
+        Array of shape (n, order) of word indices.
+    """
+
+    keys = np.asarray(keys, dtype=np.uint64)
+    n_bits = max(1, int(np.ceil(np.log2(n_words))))
+    shifts = n_bits * np.arange(order - 1, -1, -1, dtype=np.uint64)
+    mask = np.uint64(2**n_bits - 1)
+    return ((keys[:, None] >> shifts) & mask).astype(np.int64)
+
+
+def create_ngram_matrix(text, order=2):
+    """
+    Calculate the transition matrix of an order-k chain, where the
+    next word depends on the previous order words. Only contexts that
+    occur in the text get a row, indexed by a sorted array of packed
+    context keys, so memory stays linear in the length of the text.
+    With order=1 this is create_prob_matrix.
+
+    Parameters
+    ----------
+    text : array
+        Array where each entry is a word from a text
+    order : int
+        Number of previous words the next word depends on.
+
+    Returns
+    -------
+    context_keys : array
+        Sorted uint64 keys, from pack_contexts, of each context.
+    prob_matrix : scipy.sparse.csr_matrix
+        The transition matrix. Row i holds the probability of each
+        word of np.unique(text) following context_keys[i].
+    """
+
+    unique_words, index_map = np.unique(text, return_inverse=True)
+    n_words = len(unique_words)
+
+    windows = np.lib.stride_tricks.sliding_window_view(index_map, order + 1)
+    context_keys, context_map = np.unique(pack_contexts(windows[:, :-1], n_words),
+                                          return_inverse=True)
+
+    prob_matrix = count_transitions(context_map, windows[:, -1],
+                                    len(context_keys), n_words)
+
+    return context_keys, prob_matrix
+
+
+def create_transition_cdf(prob_matrix):
+    """
+    Cumulative transition probabilities, to sample the next word
+    with a binary search instead of a pass over the whole row.
+
+    Parameters
+    ----------
+    prob_matrix : sparse matrix
+        The transition matrix
+
+    Returns
+    -------
+    cdf : array
+        Array aligned with prob_matrix.indices. The entries of row i
+        are the cumulative probabilities along the row plus i, so that
+        the whole array is sorted and the next word after word i is at
+        the first entry above i + u, for u uniform in [0, 1).
+    """
+
+    prob_matrix = sp.csr_matrix(prob_matrix)
+    row_lengths = np.diff(prob_matrix.indptr)
+    rows = np.repeat(np.arange(prob_matrix.shape[0]), row_lengths)
+
+    cdf = np.cumsum(prob_matrix.data)
+    row_start = np.concatenate([[0.0], cdf])[prob_matrix.indptr[:-1]]
+    cdf -= np.repeat(row_start, row_lengths)
+
+    # Guard against round off in the last entry of each row.
+    cdf[prob_matrix.indptr[1:][row_lengths > 0] - 1] = 1.0
+
+    return cdf + rows
+
+
+def normalize_words(words):
+    """
+    Lower-case the words and strip underscores and dashes.
+
+    Parameters
+    ----------
+    words : iterable
+        Words from a text.
+
+    Returns
+    -------
+    out : list
+        The normalized words.
+    """
+
+    return [word.lower().replace("_", "").replace("-", "") for word in words]
+
+
+def read_words(path, chunk_lines=10000, encoding='utf-8'):
+    """
+    Read a plain text file a chunk of lines at a time,
+    split it into words and normalize them.
+
+    Parameters
+    ----------
+    path : str
+        Path of the text file.
+    chunk_lines : int
+        Number of lines per chunk.
+    encoding : str
+        Encoding of the text file.
+
+    Yields
+    ------
+    out : list
+        The normalized words of the next chunk of lines.
+    """
+
+    with open(path, encoding=encoding) as text_file:
+        lines = []
+        for line in text_file:
+            lines.append(line)
+            if(len(lines) == chunk_lines):
+                yield normalize_words(WORD_PATTERN.findall("".join(lines)))
+                lines = []
+        if lines:
+            yield normalize_words(WORD_PATTERN.findall("".join(lines)))
+
+
+def merge_ngram_counts(keys, counts):
+    """
+    Sum the counts of repeated n-grams.
+
+    Parameters
+    ----------
+    keys : array
+        uint64 keys, from pack_contexts, of the n-grams.
+    counts : array
+        Number of times each key was seen.
+
+    Returns
+    -------
+    keys : array
+        The unique keys, sorted.
+    counts : array
+        Total count of each unique key.
+    """
+
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse.ravel(), weights=counts,
+                             minlength=len(keys)).astype(np.int64)
+
+
+def count_file_ngrams(path, order=1, chunk_lines=10000, encoding='utf-8'):
+    """
+    Count the n-grams of one text file, streaming through it so only
+    the vocabulary and the distinct n-grams are held in memory.
+
+    Parameters
+    ----------
+    path : str
+        Path of the text file.
+    order : int
+        Number of previous words the next word depends on.
+    chunk_lines : int
+        Number of lines read at a time.
+    encoding : str
+        Encoding of the text file.
+
+    Returns
+    -------
+    words : array
+        The words of the file, in order of first appearance.
+    ngrams : array
+        Array of shape (n, order + 1) of distinct n-grams,
+        as indices into words.
+    counts : array
+        Number of times each n-gram was seen.
+    """
+
+    # The vocabulary is not known in advance, so n-grams are packed with
+    # as many bits per word as fit order + 1 words in a key.
+    capacity = 2**(64 // (order + 1))
+    word_index = {}
+
+    # Counts of each chunk are merged in pairs of tables summarizing the
+    # same number of chunks, like a binary counter, so each n-gram is
+    # merged only about log2 of the number of chunks times.
+    tables = [(0, np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64))]
+
+    # The last order words of a chunk start the n-grams of the next one.
+    tail = np.zeros(0, dtype=np.int64)
+    for words in read_words(path, chunk_lines=chunk_lines, encoding=encoding):
+        index_map = np.array([word_index.setdefault(word, len(word_index))
+                              for word in words], dtype=np.int64)
+        index_map = np.concatenate([tail, index_map])
+        tail = index_map[-order:]
+        if(len(index_map) <= order):
+            continue
+        if(len(word_index) > capacity):
+            raise ValueError("order %d n-grams of %d words do not fit in 64 bits"
+                             % (order + 1, len(word_index)))
+
+        windows = np.lib.stride_tricks.sliding_window_view(index_map, order + 1)
+        tables.append((1,) + merge_ngram_counts(pack_contexts(windows, capacity),
+                                                np.ones(len(windows))))
+        while len(tables) > 1 and tables[-2][0] <= tables[-1][0]:
+            n_a, keys_a, counts_a = tables.pop()
+            n_b, keys_b, counts_b = tables.pop()
+            tables.append((n_a + n_b,)
+                          + merge_ngram_counts(np.concatenate([keys_b, keys_a]),
+                                               np.concatenate([counts_b, counts_a])))
+
+    keys, counts = merge_ngram_counts(np.concatenate([keys for _, keys, _ in tables]),
+                                      np.concatenate([counts for _, _, counts in tables]))
+
+    return (np.array(list(word_index), dtype=str),
+            unpack_contexts(keys, order + 1, capacity), counts)
+
+
+def ingest_corpus(paths, order=1, n_workers=None, chunk_lines=10000,
+                  encoding='utf-8'):
+    """
+    Train a chain on many text files. Each file is counted in a
+    separate process by count_file_ngrams, and the counts are then
+    mapped onto one shared vocabulary and merged. N-grams are not
+    counted across the boundary between two files.
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths of the text files.
+    order : int
+        Number of previous words the next word depends on.
+    n_workers : int, optional
+        Number of processes, os.cpu_count() if None.
+    chunk_lines : int
+        Number of lines read at a time.
+    encoding : str
+        Encoding of the text files.
+
+    Returns
+    -------
+    unique_words : array
+        The sorted vocabulary of all the files.
+    context_keys : array
+        Sorted uint64 keys, from pack_contexts, of each context.
+        With order=1, the index of each word.
+    prob_matrix : scipy.sparse.csr_matrix
+        The transition matrix, as from create_ngram_matrix
+        or, with order=1, create_prob_matrix.
+
+    Examples
+    --------
+    With order=1, row i belongs to the i-th word, even when a
+    word, here the last one, is never followed by another.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile('w', suffix='.txt',
+    ...                                  delete=False) as f:
+    ...     _ = f.write("b c b c b a")
+    >>> _, _, prob_matrix = ingest_corpus([f.name])
+    >>> text = np.array("b c b c b a".split())
+    >>> print(abs(prob_matrix - create_prob_matrix(text)).max())
+    0.0
+    >>> os.remove(f.name)
+    """
+
+    args = [(path, order, chunk_lines, encoding) for path in paths]
+    if(n_workers == 1 or len(paths) == 1):
+        file_counts = [count_file_ngrams(*args_) for args_ in args]
+    else:
+        with Pool(n_workers) as pool:
+            file_counts = pool.starmap(count_file_ngrams, args)
+
+    unique_words = np.unique(np.concatenate([words for words, _, _ in file_counts]))
+    n_words = len(unique_words)
+    keys = np.concatenate([pack_contexts(np.searchsorted(unique_words, words)[ngrams],
+                                         n_words)
+                           for words, ngrams, _ in file_counts])
+    counts = np.concatenate([counts for _, _, counts in file_counts])
+    keys, counts = merge_ngram_counts(keys, counts)
+    ngrams = unpack_contexts(keys, order + 1, n_words)
+
+    if(order == 1):
+        # One row per word, as in create_prob_matrix, including
+        # words that are never followed by another, like the last.
+        context_keys = np.arange(n_words, dtype=np.uint64)
+        context_map = ngrams[:, 0]
+    else:
+        context_keys, context_map = np.unique(pack_contexts(ngrams[:, :-1], n_words),
+                                              return_inverse=True)
+    prob_matrix = count_transitions(context_map, ngrams[:, -1],
+                                    len(context_keys), n_words, counts=counts)
+
+    return unique_words, context_keys, prob_matrix
+
+
+def generate_sentence_map(prob_matrix, start_pt=0, n_words=100, cdf=None):
     """
     Given a transition matrix, generate a series of
     indices that match with words in the matrix.
 
     Parameters
     ----------
-    prob_matrix : array
+    prob_matrix : array or sparse matrix
         The transition matrix
     start_pt : int
         The index of the first word.
     n_words : int
         The number of words to generate.
+    cdf : array, optional
+        Output of create_transition_cdf(prob_matrix).
+        Computed on the fly if not given.
 
     Returns
     -------
@@ -76,54 +538,293 @@ def generate_sentence_map(prob_matrix, start_pt=0, n_words=100):
         sequence of words as derived from prob_matrix.
     """
 
-    cur_word = start_pt
-    return_map = np.zeros(n_words, dtype=int)
+    return generate_sentence_maps(prob_matrix, [start_pt],
+                                  n_words=n_words, cdf=cdf,
+                                  rng=np.random)[0]
+
+
+def generate_sentence_maps(prob_matrix, start_pts, n_words=100, cdf=None,
+                           rng=None):
+    """
+    Generate many sentences at once, each starting from its own
+    first word. All sentences take a step together, with the next
+    word of every sentence found by one binary search in the
+    cumulative transition probabilities.
+
+    Parameters
+    ----------
+    prob_matrix : array or sparse matrix
+        The transition matrix
+    start_pts : array_like
+        The index of the first word of each sentence.
+    n_words : int
+        The number of words to generate in each sentence.
+    cdf : array, optional
+        Output of create_transition_cdf(prob_matrix).
+        Computed on the fly if not given.
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
+
+    Returns
+    -------
+    out : array
+        Array of shape (len(start_pts), n_words) of indices
+        that can be converted to words.
+    """
+
+    prob_matrix = sp.csr_matrix(prob_matrix)
+    if cdf is None:
+        cdf = create_transition_cdf(prob_matrix)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    cur_word = np.array(start_pts, dtype=int)
+    return_map = np.zeros((len(cur_word), n_words), dtype=int)
     for i in range(n_words):
-        return_map[i] = cur_word
-        next_word = np.random.choice(np.arange(prob_matrix.shape[0]),
-                                     p=prob_matrix[cur_word])
-        cur_word = next_word
+        return_map[:, i] = cur_word
+        if(i == n_words - 1):
+            break
+        cur_word = sample_next_words(prob_matrix, cdf, cur_word, rng)
+    return return_map
+
+
+def generate_ngram_sentence_maps(context_keys, prob_matrix, start_contexts,
+                                 n_words=100, cdf=None, rng=None):
+    """
+    Generate many sentences at once from an order-k chain.
+    The row of each sentence's current context is found
+    by a binary search in the sorted context keys.
+
+    Parameters
+    ----------
+    context_keys : array
+        Sorted context keys, from create_ngram_matrix.
+    prob_matrix : sparse matrix
+        The transition matrix, from create_ngram_matrix.
+    start_contexts : array_like
+        Array of shape (n_sentences, order) with the indices
+        of the first order words of each sentence.
+    n_words : int
+        The number of words to generate in each sentence,
+        including the starting context.
+    cdf : array, optional
+        Output of create_transition_cdf(prob_matrix).
+        Computed on the fly if not given.
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
+
+    Returns
+    -------
+    out : array
+        Array of shape (n_sentences, n_words) of indices
+        that can be converted to words.
+    """
+
+    prob_matrix = sp.csr_matrix(prob_matrix)
+    if cdf is None:
+        cdf = create_transition_cdf(prob_matrix)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    start_contexts = np.atleast_2d(start_contexts)
+    order = start_contexts.shape[1]
+
+    return_map = np.zeros((len(start_contexts), n_words), dtype=int)
+    return_map[:, :order] = start_contexts[:, :n_words]
+    for i in range(order, n_words):
+        keys = pack_contexts(return_map[:, i-order:i], prob_matrix.shape[1])
+        rows = np.searchsorted(context_keys, keys)
+        if not np.all(context_keys[np.minimum(rows, len(context_keys) - 1)] == keys):
+            raise ValueError("reached a context that is not in the text")
+        return_map[:, i] = sample_next_words(prob_matrix, cdf, rows, rng)
     return return_map
 
 
-def print_sentence_map(text, sentence_map):
+def sample_next_words(prob_matrix, cdf, rows, rng):
+    """
+    Draw the next word after each row of the transition matrix.
+
+    Parameters
+    ----------
+    prob_matrix : scipy.sparse.csr_matrix
+        The transition matrix
+    cdf : array
+        Output of create_transition_cdf(prob_matrix).
+    rows : array
+        Row of the transition matrix of each sentence.
+    rng : numpy.random.Generator
+        Random number generator.
+
+    Returns
+    -------
+    out : array
+        Index of the next word of each sentence.
+    """
+
+    if not np.all(prob_matrix.indptr[rows + 1] > prob_matrix.indptr[rows]):
+        raise ValueError("reached a word that is never followed "
+                         "by another word in the text")
+    target = rows + rng.random(len(rows))
+    # rows + u can round up to rows + 1, which would land
+    # in the next row, so stop at the last entry of the row.
+    pos = np.minimum(np.searchsorted(cdf, target, side='right'),
+                     prob_matrix.indptr[rows + 1] - 1)
+    return prob_matrix.indices[pos]
+
+
+def save_model(path, unique_words, prob_matrix, context_keys=None, cdf=None,
+               order=None):
+    """
+    Save a trained chain as a directory of .npy files,
+    one per array, so it can be memory-mapped by load_model.
+
+    Parameters
+    ----------
+    path : str
+        Directory to save the model in, created if needed.
+    unique_words : array
+        The vocabulary, np.unique(text).
+    prob_matrix : sparse matrix
+        The transition matrix
+    context_keys : array, optional
+        Context keys, for a chain from create_ngram_matrix.
+    cdf : array, optional
+        Output of create_transition_cdf(prob_matrix).
+        Computed here if not given.
+    order : int, optional
+        Number of previous words the next word depends on,
+        stored with the model and checked by load_model.
+        Has to be given with context_keys, 1 without them.
+    """
+
+    if context_keys is None:
+        order = 1 if order is None else order
+        if(order != 1):
+            raise ValueError("an order %d model needs its context_keys" % order)
+    elif order is None or order < 2:
+        raise ValueError("context_keys need the order of the model, above 1")
+
+    prob_matrix = sp.csr_matrix(prob_matrix)
+    if cdf is None:
+        cdf = create_transition_cdf(prob_matrix)
+
+    # Files of a model saved here before are removed first, so that an
+    # interrupted save has no format.npy and stale keys are not kept.
+    os.makedirs(path, exist_ok=True)
+    for name in ["format.npy", "context_keys.npy"]:
+        if os.path.exists(os.path.join(path, name)):
+            os.remove(os.path.join(path, name))
+    np.save(os.path.join(path, "words.npy"), np.asarray(unique_words, dtype=str))
+    np.save(os.path.join(path, "indptr.npy"), prob_matrix.indptr)
+    np.save(os.path.join(path, "indices.npy"), prob_matrix.indices)
+    np.save(os.path.join(path, "data.npy"), prob_matrix.data)
+    np.save(os.path.join(path, "cdf.npy"), cdf)
+    if context_keys is not None:
+        np.save(os.path.join(path, "context_keys.npy"), context_keys)
+    np.save(os.path.join(path, "format.npy"), np.array([MODEL_FORMAT, order]))
+
+
+def load_model(path, mmap_mode='r', order=None):
+    """
+    Load a chain saved by save_model. By default the arrays are
+    memory-mapped read-only, so loading takes no time and many
+    processes generating from the same model share one copy of it.
+
+    Parameters
+    ----------
+    path : str
+        Directory the model was saved in.
+    mmap_mode : str or None
+        Passed to np.load, None reads the arrays into memory.
+    order : int, optional
+        Order the model has to have, any if None.
+
+    Returns
+    -------
+    unique_words : array
+        The vocabulary.
+    prob_matrix : scipy.sparse.csr_matrix
+        The transition matrix, backed by the files.
+    cdf : array
+        Cumulative transition probabilities.
+    context_keys : array or None
+        Context keys, if the model is an order-k chain.
+    """
+
+    def load(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+
+    if not os.path.isdir(path):
+        raise FileNotFoundError("no model saved in %s" % path)
+    format_path = os.path.join(path, "format.npy")
+    if not os.path.exists(format_path):
+        raise ValueError("%s was saved without a format version" % path)
+    model_format, model_order = np.load(format_path)
+    if(model_format != MODEL_FORMAT):
+        raise ValueError("%s has format %d, expected %d"
+                         % (path, model_format, MODEL_FORMAT))
+    if order is not None and model_order != order:
+        raise ValueError("%s is an order %d model, expected %d"
+                         % (path, model_order, order))
+
+    unique_words = load("words")
+    indptr = load("indptr")
+    prob_matrix = sp.csr_matrix((load("data"), load("indices"), indptr),
+                                shape=(len(indptr) - 1, len(unique_words)),
+                                copy=False)
+
+    has_keys = os.path.exists(os.path.join(path, "context_keys.npy"))
+    if(has_keys != (model_order > 1)):
+        raise ValueError("%s is an order %d model %s context keys"
+                         % (path, model_order, "with" if has_keys else "without"))
+    context_keys = load("context_keys") if has_keys else None
+
+    return unique_words, prob_matrix, load("cdf"), context_keys
+
+
+def print_sentence_map(vocabulary, sentence_map):
     """
     Translate indices to words and prints it.
 
     Parameters
     ----------
-    text : array
-        Array where each entry is a word from a text
+    vocabulary : Vocabulary or array
+        The Vocabulary of the chain, or an array where
+        each entry is a word from a text.
     sentence_map : array
         Array of indices generated from the transition
         matrix that needs to be converted.
     """
 
-    unique_words = np.unique(text)
-    punct = np.array([".", ",", ")", "(", "?", "!", ":", "'", ";"])
+    if not isinstance(vocabulary, Vocabulary):
+        vocabulary = Vocabulary(np.unique(vocabulary))
 
-    for sentence_map_ in sentence_map:
-        cur_word = unique_words[sentence_map_]
-        start = " "
-        if np.any(punct == cur_word):
-            start = ""
-        print(start + cur_word, end="")
-    print("")
+    vocabulary.write(sentence_map)
 
 
 if __name__ == "__main__":
 
-    # Load the text from Jane Austen's Emma.
-    text = gutenberg.words('austen-emma.txt')
-    text = np.array([word.lower() for word in text])
-    text = np.array([word.replace("_", "") for word in text])
-    text = np.array([word.replace("-", "") for word in text])
+    # A model trained once is reused from disk on later runs,
+    # unless it was saved by another version of this code.
+    model_path = "./austen_emma_model"
+
+    try:
+        unique_words, prob_matrix, cdf, _ = load_model(model_path, order=1)
+    except (OSError, ValueError):
+        from nltk.corpus import gutenberg
+
+        # Stream Jane Austen's Emma from the corpus and calculate
+        # the transition matrix. Passing more gutenberg.fileids(),
+        # or any plain text files, trains on all of them in parallel.
+        paths = [gutenberg.abspath('austen-emma.txt')]
+        unique_words, _, prob_matrix = ingest_corpus(paths, encoding='latin1')
+        cdf = create_transition_cdf(prob_matrix)
+        save_model(model_path, unique_words, prob_matrix, cdf=cdf, order=1)
 
-    # Calculate the transition matrix.
-    prob_matrix = create_prob_matrix(text)
+    vocabulary = Vocabulary(unique_words)
 
     # Generate a sentence.
-    sentence_map = generate_sentence_map(prob_matrix)
+    sentence_map = generate_sentence_map(prob_matrix, cdf=cdf)
 
     # Print the sentence.
-    print_sentence_map(text, sentence_map)
+    print_sentence_map(vocabulary, sentence_map)
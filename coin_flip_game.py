@@ -19,9 +19,14 @@ gives the analytical result.
 The probability of the ith player winning is
 P = Sum_{k=0}^{infty} (1/2)^{n*k + ith_player},
 where n = number of players in the game.
+The series is summed in closed form by 'win_probabilities',
+which also handles biased coins.
 """
 
 
+from fractions import Fraction
+from math import gcd
+
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -52,27 +57,231 @@ def game(n_players=2):
     return int(i % n_players)
 
 
+def games(n_games, n_players=2, p_heads=0.5, rng=None, return_length=False):
+    """
+    Many Toy MC iterations of the coin toss game at once.
+
+    The coins follow a schedule of head probabilities, one per
+    toss, that repeats once it runs out. Instead of tossing coin
+    by coin, each game draws the number of full passes through the
+    schedule without a heads, a geometric number, and then the
+    toss of the first heads within the last pass.
+
+    Parameters
+    ----------
+    n_games : int
+        Number of games to play.
+    n_players : int
+        Number of players in the game.
+    p_heads : float or array_like
+        Probability of heads on each toss of the schedule.
+        A float is the same coin for everyone, and an array
+        of length n_players is one coin per player.
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
+    return_length : bool
+        If true, also return the number of tosses of each game.
+
+    Returns
+    -------
+    out : array
+        Which player won each game.
+        The first player is player number 0
+    length : array
+        Only if return_length. Number of tosses in each game.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    p_heads = np.atleast_1d(np.asarray(p_heads, dtype=float))
+    n_schedule = len(p_heads)
+
+    # Probability that the first heads of a pass is on toss j of the
+    # schedule, and that a whole pass has no heads, in logs as in
+    # win_probabilities, so small head probabilities keep their precision.
+    with np.errstate(divide='ignore'):
+        log_no_heads = np.concatenate([[0.0], np.cumsum(np.log1p(-p_heads))])
+    p_first = p_heads * np.exp(log_no_heads[:-1])
+    log_p_no_heads = log_no_heads[-1]
+    p_some_heads = -np.expm1(log_p_no_heads)
+    if(p_some_heads == 0.0):
+        raise ValueError("the coins never land heads")
+
+    # Geometric number of passes without heads, R = period Q + S. The
+    # winner only depends on S, which is drawn exactly, with
+    # P(S = s) proportional to q^s for s < period, while Q, geometric
+    # in q^period and independent of S, comes from an exponential,
+    # as P(floor(E / -log(q^period)) >= k) = q^(period k). With rare
+    # heads Q can be too large for a float to hold exactly.
+    period = n_players // gcd(n_schedule, n_players)
+    if(log_p_no_heads == -np.inf):
+        n_periods = np.zeros(n_games, dtype=np.int64)
+        n_extra = np.zeros(n_games, dtype=np.int64)
+    else:
+        n_periods = np.floor(rng.standard_exponential(n_games)
+                             / (-period * log_p_no_heads)).astype(np.int64)
+        cdf = np.cumsum(np.exp(np.arange(period) * log_p_no_heads))
+        n_extra = np.searchsorted(cdf / cdf[-1], rng.random(n_games),
+                                  side='right')
+        n_extra = np.minimum(n_extra, period - 1)
+    if(n_schedule == 1):
+        first_heads = 0
+    else:
+        cdf = np.cumsum(p_first) / p_some_heads
+        first_heads = np.searchsorted(cdf, rng.random(n_games), side='right')
+        first_heads = np.minimum(first_heads, n_schedule - 1)
+
+    # Whole periods of passes do not change the winner.
+    winner = (n_extra * n_schedule + first_heads) % n_players
+    if return_length:
+        return winner, (n_periods * period + n_extra) * n_schedule + first_heads + 1
+    return winner
+
+
+def win_probabilities(n_players=2, p_heads=0.5, exact=False):
+    """
+    Exact probability of each player winning the coin toss game,
+    and the mean and variance of the number of tosses.
+
+    With the coins following a repeating schedule of L tosses, as in
+    'games', the first heads is on toss r*L + j with probability
+    q^r a_j, where q is the probability of a pass without heads and
+    a_j that of the first heads of a pass on toss j. The winner only
+    depends on r modulo g = n / gcd(L, n), so each geometric series in
+    r sums in closed form and the whole calculation is O(L g), or O(n)
+    for one coin or one coin per player.
+
+    Parameters
+    ----------
+    n_players : int
+        Number of players in the game.
+    p_heads : float or array_like
+        Probability of heads on each toss of the schedule,
+        as in 'games'.
+    exact : bool
+        If true, calculate with fractions.Fraction, without round
+        off. The probabilities can then also be given as Fractions
+        or strings such as "1/3".
+
+    Returns
+    -------
+    probabilities : array
+        Probability that each player wins, first player first.
+        An array of Fractions if exact.
+    mean : float or Fraction
+        Expectation value of the number of tosses in a game.
+    variance : float or Fraction
+        Variance of the number of tosses in a game.
+    """
+
+    if exact:
+        p_heads = [Fraction(p) for p in np.atleast_1d(p_heads).tolist()]
+        n_schedule = len(p_heads)
+
+        p_first = []
+        p_no_heads = Fraction(1)
+        for p in p_heads:
+            p_first.append(p_no_heads * p)
+            p_no_heads *= 1 - p
+        p_some_heads = 1 - p_no_heads
+        if(p_some_heads == 0):
+            raise ValueError("the coins never land heads")
+
+        period = n_players // gcd(n_schedule, n_players)
+        norm = 1 - p_no_heads**period
+        probabilities = np.array([Fraction(0)] * n_players, dtype=object)
+        for r in range(period):
+            for j in range(n_schedule):
+                probabilities[(r * n_schedule + j) % n_players] += \
+                    p_first[j] * p_no_heads**r / norm
+    else:
+        p_heads = np.atleast_1d(np.asarray(p_heads, dtype=float))
+        n_schedule = len(p_heads)
+
+        # Work with logs of the probability of no heads,
+        # so small head probabilities keep their precision.
+        with np.errstate(divide='ignore'):
+            log_no_heads = np.concatenate([[0.0], np.cumsum(np.log1p(-p_heads))])
+        p_first = p_heads * np.exp(log_no_heads[:-1])
+        log_p_no_heads = log_no_heads[-1]
+        p_no_heads = np.exp(log_p_no_heads)
+        p_some_heads = -np.expm1(log_p_no_heads)
+        if(p_some_heads == 0.0):
+            raise ValueError("the coins never land heads")
+
+        period = n_players // gcd(n_schedule, n_players)
+        norm = -np.expm1(period * log_p_no_heads)
+        r = np.arange(period)[:, None]
+        j = np.arange(n_schedule)[None, :]
+        probabilities = np.bincount(((r * n_schedule + j) % n_players).ravel(),
+                                    weights=(p_first * p_no_heads**r / norm).ravel(),
+                                    minlength=n_players)
+
+    # Tosses = R L + J + 1, with R the geometric number of passes
+    # without heads and J the toss of the first heads in its pass.
+    p_toss = [p / p_some_heads for p in p_first]
+    mean_toss = sum(j * p for j, p in enumerate(p_toss))
+    var_toss = sum((j - mean_toss)**2 * p for j, p in enumerate(p_toss))
+    mean_passes = p_no_heads / p_some_heads
+    var_passes = p_no_heads / p_some_heads**2
+
+    mean = n_schedule * mean_passes + mean_toss + 1
+    variance = n_schedule**2 * var_passes + var_toss
+
+    return probabilities, mean, variance
+
+
+def validate_games(hist_of_winners, probabilities):
+    """
+    Compare the Toy MC against the exact win probabilities.
+
+    Parameters
+    ----------
+    hist_of_winners : array
+        Number of games won by each player.
+    probabilities : array
+        Exact probability that each player wins,
+        from 'win_probabilities'.
+
+    Returns
+    -------
+    out : array
+        Pull of each player, the difference between the
+        number of games won and the expected number,
+        in units of its binomial standard deviation.
+    """
+
+    n_games = np.sum(hist_of_winners)
+    probabilities = np.asarray(probabilities, dtype=float)
+    expected = n_games * probabilities
+    return ((hist_of_winners - expected)
+            / np.sqrt(expected * (1.0 - probabilities)))
+
+
 if __name__ == '__main__':
 
-    n_games = 1000
+    n_games = 100000000
     n_players = 3
 
-    # Run the toy MC.
-    winning_players = np.array([game(n_players) for i in range(n_games)])
-
-    # Post-process the toy MC to make the PDF.
-    hist_of_winners, edges_of_winners = np.histogram(winning_players,
-                                                     range=(0, n_players),
-                                                     bins=n_players)
+    # Run the toy MC, in chunks of games to bound the memory.
+    rng = np.random.default_rng()
+    chunk_size = 10000000
+    hist_of_winners = np.zeros(n_players, dtype=int)
+    for start in range(0, n_games, chunk_size):
+        winning_players = games(min(chunk_size, n_games - start), n_players, rng=rng)
+        hist_of_winners += np.bincount(winning_players, minlength=n_players)
 
-    centers_of_winners = edges_of_winners[1:]
+    centers_of_winners = np.arange(1, n_players + 1)
     err_on_hist_of_winners = np.sqrt(hist_of_winners) / n_games
 
     # Run the analytical calculation.
+    P_sums, mean_tosses, var_tosses = win_probabilities(n_players)
 
-    ks = np.arange(1000)  # Take the sum up to k = 999, a fair approximation.
-    P_sums = np.array([np.sum(np.power(0.5, n_players*ks + ith_player))
-                       for ith_player in np.arange(1, n_players+1)])
+    # The Toy MC should agree with it within statistical errors.
+    pulls = validate_games(hist_of_winners, P_sums)
+    print("Pull of each player: ", pulls)
+    assert np.all(np.abs(pulls) < 5.0), "Toy MC disagrees with the exact result"
 
     # Plot the results.
 
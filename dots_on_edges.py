@@ -10,7 +10,9 @@ The analytical result is straight forward:
 P = (1.0 / n_edges)**(n_dots - 1)
 
 I compare this result with a probability
-calculated from a Toy MC
+calculated from a Toy MC, and from a Toy MC
+that uses importance sampling to reach small
+probabilities with few throws.
 
 """
 
@@ -41,26 +43,160 @@ def place_dots(n_dots, n_edges):
     return len(np.unique(spots)) == 1
 
 
+def sweep_place_dots(n_dots, n_edges, n_throws, rng=None, chunk_size=10000):
+    """
+    Toy MC of placing the dots, on a grid of n_dots and n_edges.
+
+    All dots of a chunk of throws are drawn for every n_edges as one
+    integer array. The first d dots of a throw are the throw for
+    n_dots = d, so a running min and max along the dots tells if
+    they are all on one edge for every n_dots at once.
+
+    Parameters
+    ----------
+    n_dots : array_like
+        Numbers of dots to place.
+    n_edges : array_like
+        Numbers of edges of shape.
+    n_throws : int
+        Number of Toy MC throws per grid point.
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
+    chunk_size : int
+        Number of throws held in memory at once.
+
+    Returns
+    -------
+    probs : array
+        Array of shape (len(n_dots), len(n_edges)) of the probability
+        that all dots are on the same edge.
+    errs : array
+        Binomial standard error on probs.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    n_dots = np.atleast_1d(n_dots)
+    n_edges = np.atleast_1d(n_edges)
+    max_dots = np.max(n_dots)
+
+    n_same = np.zeros((len(n_dots), len(n_edges)))
+    for start in range(0, n_throws, chunk_size):
+        n_chunk = min(chunk_size, n_throws - start)
+        spots = rng.integers(n_edges[:, None, None],
+                             size=(len(n_edges), n_chunk, max_dots))
+
+        same = (np.minimum.accumulate(spots, axis=2)
+                == np.maximum.accumulate(spots, axis=2))
+        n_same += np.sum(same[:, :, n_dots - 1], axis=1).T
+
+    probs = n_same / n_throws
+    errs = np.sqrt(probs * (1.0 - probs) / n_throws)
+
+    return probs, errs
+
+
+def place_dots_importance(n_dots, n_edges, rel_err=0.01, theta=0.9,
+                          batch_size=10000, max_throws=10000000, rng=None):
+    """
+    Importance sampling Toy MC of placing the dots
+
+    Instead of placing the dots uniformly, an edge is picked at random
+    and each dot lands on it with probability theta, or on a uniformly
+    random edge otherwise, so most throws have all dots on one edge.
+    Each throw is weighted by the ratio of the uniform probability
+    of its dots to their probability under this scheme.
+    With A = n_edges theta + 1 - theta, B = 1 - theta
+    and c the number of dots on each edge, the weight is
+    n_edges / (sum_{edges with dots} A^c B^(n_dots - c)
+               + (n_edges - n_edges with dots) B^n_dots).
+
+    Throws are made in batches until the relative error of the
+    estimate is below rel_err.
+
+    Parameters
+    ----------
+    n_dots : int
+        Number of dots to place.
+    n_edges : int
+        Number of edges of shape.
+    rel_err : float
+        Target relative error of the probability.
+    theta : float
+        Probability of a dot landing on the picked edge,
+        from 0 (uniform Toy MC) to below 1.
+    batch_size : int
+        Number of throws per batch.
+    max_throws : int
+        Stop after this many throws, even if rel_err is not reached.
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
+
+    Returns
+    -------
+    prob : float
+        Probability that all dots are on the same edge.
+    err : float
+        Standard error on prob.
+    n_throws : int
+        Number of throws made.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    a = n_edges * theta + 1.0 - theta
+    b = 1.0 - theta
+
+    n_throws, sum_w, sum_w2 = 0, 0.0, 0.0
+    prob, err = 0.0, np.inf
+    while n_throws < max_throws:
+        picked = rng.integers(n_edges, size=(batch_size, 1))
+        spots = np.where(rng.random((batch_size, n_dots)) < theta,
+                         picked,
+                         rng.integers(n_edges, size=(batch_size, n_dots)))
+
+        # Number of dots on the same edge as each dot.
+        counts = np.sum(spots[:, :, None] == spots[:, None, :], axis=2)
+        n_hit_edges = np.sum(1.0 / counts, axis=1)
+        norm = (np.sum(np.power(a, counts) * np.power(b, n_dots - counts) / counts,
+                       axis=1)
+                + (n_edges - n_hit_edges) * b**n_dots)
+        w = np.where(counts[:, 0] == n_dots, n_edges / norm, 0.0)
+
+        n_throws += batch_size
+        sum_w += np.sum(w)
+        sum_w2 += np.sum(np.square(w))
+
+        prob = sum_w / n_throws
+        err = np.sqrt(max(sum_w2 / n_throws - prob**2, 0.0) / n_throws)
+        if(prob > 0.0 and err < rel_err * prob):
+            break
+
+    return prob, err, n_throws
+
+
 if __name__ == "__main__":
-    n_throws = 10000
+    n_throws = 1000000
 
     n_dots = 3
     n_edges = np.arange(2, 51)
-    probs = np.zeros(len(n_edges))
+    probs, errs = sweep_place_dots(n_dots, n_edges, n_throws)
+    probs = probs[0]
 
+    # Importance sampling, to 1% on every point.
+    probs_is = np.zeros(len(n_edges))
+    errs_is = np.zeros(len(n_edges))
     for i, n_edges_ in enumerate(n_edges):
-
-        vfunc_place_dots = np.vectorize(place_dots)
-
-        results = vfunc_place_dots(n_dots * np.ones(n_throws, dtype='int'),
-                                   n_edges_ * np.ones(n_throws, dtype='int'))
-
-        probs[i] = float(np.sum(results) / n_throws)
+        probs_is[i], errs_is[i], _ = place_dots_importance(n_dots, n_edges_)
 
     plt.figure()
     plt.title(r"Probability that $N_{dots} = 3$ are all on one edge of shape.")
     plt.semilogy(n_edges, probs,
                  label="Numerical Result", color="black")
+    plt.errorbar(n_edges, probs_is, yerr=errs_is,
+                 fmt='.', label="Importance Sampling Result", color="blue")
     plt.semilogy(n_edges, np.power(1/n_edges, n_dots-1),
                  label="Analytical Result", color="red", alpha=0.5)
     plt.xlabel(r"$N_{edges}$")
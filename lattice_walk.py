@@ -0,0 +1,383 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Lattice random walks
+
+The Optiver puzzles all walk an ant from the origin
+of a square lattice, one step in a random cardinal
+direction every second, until it reaches food.
+Only where the food is changes between them.
+
+Instead of walking one ant at a time, the function
+`walk_until` walks many ants together. The food is
+given as a function of the ant coordinates that works
+on whole arrays of ants, and ants that reached it are
+dropped from the walk.
+
+When the ant is trapped in a finite region, the function
+`exit_time` instead solves for the exact mean, variance
+and PMF of the time to reach food.
+
+A `Region` holds the food, and barriers the ant bounces
+off, as a bitmap of the lattice, so that testing a batch
+of ants is one lookup, whatever the shape. It can be made
+from a food condition, from arrays, or loaded from a file.
+"""
+
+
+import numpy as np
+import scipy.ndimage
+import scipy.sparse as sp
+import scipy.sparse.linalg
+
+
+# Steps in the order of move_dir: +x, +y, -x, -y.
+STEP_X = np.array([1, 0, -1, 0])
+STEP_Y = np.array([0, 1, 0, -1])
+
+# Codes of the sites of a Region.
+OPEN = 0
+FOOD = 1
+BARRIER = 2
+
+
+class Region:
+    """
+    Bitmap of the lattice, with a code for every site:
+    OPEN, FOOD, or BARRIER, which the ant cannot step on.
+    Sites off the bitmap all have the code `outside`.
+
+    A Region is itself a food condition, so it can be
+    passed to walk_until and exit_time, which then also
+    keep the ants off its barriers.
+
+    Parameters
+    ----------
+    cells : array
+        2D integer array of site codes.
+    offset : tuple of int
+        Lattice coordinates (x, y) of cells[0, 0].
+    outside : int
+        Code of the sites off the bitmap.
+    """
+
+    def __init__(self, cells, offset=(0, 0), outside=FOOD):
+        self.cells = np.asarray(cells, dtype=np.int8)
+        self.offset = (int(offset[0]), int(offset[1]))
+        self.outside = outside
+
+        # A border of outside sites, so any site off the bitmap
+        # can be clipped onto the border and looked up as well.
+        self._padded = np.pad(self.cells, 1, constant_values=outside)
+        self._flat = self._padded.ravel()
+        self.has_barriers = bool(np.any(self._padded == BARRIER))
+
+    @classmethod
+    def from_predicate(cls, absorbed, max_sites=10000000):
+        """
+        Bitmap of a food condition, evaluated once on the sites
+        the ant can reach, see interior_mask. Sites it cannot
+        reach are marked as food.
+        """
+        mask, offset = interior_mask(absorbed, max_sites=max_sites)
+        return cls(np.where(mask, OPEN, FOOD), offset)
+
+    @classmethod
+    def from_mask(cls, food, offset=(0, 0), barrier=None, outside=FOOD):
+        """
+        Bitmap from a boolean array of the food sites and,
+        optionally, one of the barrier sites.
+        """
+        cells = np.where(food, FOOD, OPEN)
+        if barrier is not None:
+            cells[barrier] = BARRIER
+        return cls(cells, offset, outside)
+
+    @classmethod
+    def load(cls, path, offset=(0, 0), outside=FOOD):
+        """
+        Read a bitmap written by save, or an .npy array of
+        site codes placed at offset.
+        """
+        data = np.load(path)
+        if isinstance(data, np.ndarray):
+            return cls(data, offset, outside)
+        with data:
+            return cls(data['cells'], tuple(data['offset']),
+                       int(data['outside']))
+
+    def save(self, path):
+        """
+        Write the bitmap to an .npz file.
+        """
+        np.savez(path, cells=self.cells, offset=np.array(self.offset),
+                 outside=self.outside)
+
+    def code(self, x, y):
+        """
+        Code of the sites at lattice coordinates x, y.
+        """
+        n_x, n_y = self._padded.shape
+        i = np.clip(np.asarray(x) - (self.offset[0] - 1), 0, n_x - 1)
+        j = np.clip(np.asarray(y) - (self.offset[1] - 1), 0, n_y - 1)
+        return np.take(self._flat, i * n_y + j)
+
+    def __call__(self, x, y):
+        return self.code(x, y) == FOOD
+
+    def blocked(self, x, y):
+        """
+        True where the sites are barriers.
+        """
+        return self.code(x, y) == BARRIER
+
+
+def region_blocked(absorbed, blocked):
+    """
+    Barrier condition to use for absorbed: blocked if given,
+    otherwise that of absorbed when it is a Region with barriers.
+    """
+    if blocked is None and isinstance(absorbed, Region) \
+            and absorbed.has_barriers:
+        return absorbed.blocked
+    return blocked
+
+
+def walk_until(absorbed, n_walkers, max_step=None, rng=None, blocked=None):
+    """
+    Randomly walks many ants until each of them reaches food.
+    Effectively a markov chain with a stopping condition.
+
+    Parameters
+    ----------
+    absorbed : callable
+        absorbed(x, y) takes integer arrays of lattice coordinates,
+        in steps, and returns a boolean array that is true for the
+        ants that reached food.
+    n_walkers : int
+        Number of ants to walk.
+    max_step : int, optional
+        Ants still walking after max_step steps are stopped
+        and reported as taking max_step steps.
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
+    blocked : callable, optional
+        blocked(x, y) is true on barrier sites. An ant that would
+        step onto one stays where it is for that step. Taken from
+        absorbed if it is a Region.
+
+    Returns
+    -------
+    out : array
+        Number of steps each ant took to reach food.
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+    blocked = region_blocked(absorbed, blocked)
+
+    x = np.zeros(n_walkers, dtype=int)
+    y = np.zeros(n_walkers, dtype=int)
+    walker = np.arange(n_walkers)
+    results = np.zeros(n_walkers, dtype=int)
+
+    # Ants that start on food take no steps.
+    done = absorbed(x, y)
+    walker, x, y = walker[~done], x[~done], y[~done]
+
+    step = 0
+    while len(walker) > 0 and (max_step is None or step < max_step):
+        move_dir = rng.integers(4, size=len(walker))
+        if blocked is None:
+            x += STEP_X[move_dir]
+            y += STEP_Y[move_dir]
+        else:
+            new_x = x + STEP_X[move_dir]
+            new_y = y + STEP_Y[move_dir]
+            moves = ~blocked(new_x, new_y)
+            x[moves] = new_x[moves]
+            y[moves] = new_y[moves]
+        step += 1
+
+        done = absorbed(x, y)
+        results[walker[done]] = step
+        walker, x, y = walker[~done], x[~done], y[~done]
+
+    results[walker] = step
+
+    return results
+
+
+def interior_mask(absorbed, max_sites=10000000, blocked=None):
+    """
+    Find the sites the ant can reach from the origin without
+    reaching food, by labelling the connected region of sites
+    without food around the origin in a box that is doubled in
+    size until the region no longer touches its edges.
+
+    Parameters
+    ----------
+    absorbed : callable
+        Food condition, as in walk_until.
+    max_sites : int
+        Give up once the box holds more sites than this.
+    blocked : callable, optional
+        Barrier condition, as in walk_until.
+
+    Returns
+    -------
+    mask : array
+        2D boolean array, true on the sites of the region.
+    offset : tuple of int
+        Lattice coordinates (x, y) of mask[0, 0].
+    """
+
+    blocked = region_blocked(absorbed, blocked)
+
+    half_width = 4
+    while (2 * half_width + 1)**2 <= max_sites:
+        coords = np.arange(-half_width, half_width + 1)
+        x, y = np.meshgrid(coords, coords, indexing='ij')
+        free = ~absorbed(x, y)
+        if blocked is not None:
+            free &= ~blocked(x, y)
+        labels, _ = scipy.ndimage.label(free)
+
+        region = labels == labels[half_width, half_width]
+        if(labels[half_width, half_width] == 0):
+            region[:] = False
+            return region[:1, :1], (0, 0)
+
+        if not (np.any(region[0]) or np.any(region[-1])
+                or np.any(region[:, 0]) or np.any(region[:, -1])):
+            rows = np.flatnonzero(np.any(region, axis=1))
+            cols = np.flatnonzero(np.any(region, axis=0))
+            mask = region[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+            return mask, (rows[0] - half_width, cols[0] - half_width)
+
+        half_width *= 2
+
+    raise ValueError("the region around the origin is unbounded "
+                     "or has more than max_sites sites")
+
+
+def exit_time(absorbed, max_step=1000, max_sites=10000000, blocked=None):
+    """
+    Exact distribution of the number of steps an ant walks from the
+    origin before reaching food, when it can only wander a finite
+    region. With Q the transition matrix between sites of the
+    region, the expected time t to reach food from every site solves
+    (I - Q) t = 1, the discrete Laplace equation, and the second
+    moment s solves (I - Q) s = 1 + 2 Q t. The PMF is found by pushing
+    the probability of the ant being at each site forward one step
+    at a time and collecting what leaves the region.
+
+    Parameters
+    ----------
+    absorbed : callable
+        Food condition, as in walk_until.
+    max_step : int
+        Number of steps to compute the PMF for.
+    max_sites : int
+        Largest box searched for the region, see interior_mask.
+    blocked : callable, optional
+        Barrier condition, as in walk_until.
+
+    Returns
+    -------
+    mean : float
+        Expectation value of the number of steps.
+    variance : float
+        Variance of the number of steps.
+    pmf : array
+        Probability that the ant took n steps,
+        for n = 0, ..., max_step.
+    """
+
+    blocked = region_blocked(absorbed, blocked)
+
+    mask, offset = interior_mask(absorbed, max_sites=max_sites,
+                                 blocked=blocked)
+    return mask_exit_time(mask, offset, max_step=max_step, blocked=blocked)
+
+
+def mask_exit_time(mask, offset, max_step=1000, blocked=None):
+    """
+    Same as exit_time, for the region given as a boolean mask.
+
+    Parameters
+    ----------
+    mask : array
+        2D boolean array, true on the sites of the region.
+    offset : tuple of int
+        Lattice coordinates (x, y) of mask[0, 0].
+    max_step : int
+        Number of steps to compute the PMF for.
+    blocked : callable, optional
+        Barrier condition, as in walk_until. Steps from the region
+        onto a barrier leave the ant where it is.
+
+    Returns
+    -------
+    mean : float
+        Expectation value of the number of steps.
+    variance : float
+        Variance of the number of steps.
+    pmf : array
+        Probability that the ant took n steps,
+        for n = 0, ..., max_step.
+    """
+
+    pmf = np.zeros(max_step + 1)
+    origin = (-offset[0], -offset[1])
+    if not (0 <= origin[0] < mask.shape[0] and 0 <= origin[1] < mask.shape[1]
+            and mask[origin]):
+        pmf[0] = 1.0
+        return 0.0, 0.0, pmf
+
+    # Number the sites of the region, -1 everywhere else,
+    # with a border of -1 so every neighbour can be looked up.
+    n_sites = np.count_nonzero(mask)
+    site = -np.ones((mask.shape[0] + 2, mask.shape[1] + 2), dtype=np.int64)
+    site[1:-1, 1:-1][mask] = np.arange(n_sites)
+    i, j = np.nonzero(mask)
+
+    rows, cols = [], []
+    for step_x, step_y in zip(STEP_X, STEP_Y):
+        neighbour = site[i + 1 + step_x, j + 1 + step_y]
+        inside = neighbour >= 0
+        rows.append(site[i + 1, j + 1][inside])
+        cols.append(neighbour[inside])
+        if blocked is not None:
+            stays = ~inside & blocked(i + offset[0] + step_x,
+                                      j + offset[1] + step_y)
+            rows.append(site[i + 1, j + 1][stays])
+            cols.append(site[i + 1, j + 1][stays])
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    # Duplicate entries, from several blocked steps, are summed.
+    q = sp.csr_matrix((np.full(len(rows), 0.25), (rows, cols)),
+                      shape=(n_sites, n_sites))
+
+    # I - Q is symmetric, so a symmetric ordering keeps the fill in
+    # of the LU factors of the lattice Laplacian down.
+    lu = scipy.sparse.linalg.splu((sp.identity(n_sites) - q).tocsc(),
+                                  permc_spec='MMD_AT_PLUS_A',
+                                  options=dict(SymmetricMode=True))
+    t = lu.solve(np.ones(n_sites))
+    s = lu.solve(1.0 + 2.0 * (q @ t))
+
+    start = site[origin[0] + 1, origin[1] + 1]
+    mean = t[start]
+    variance = s[start] - mean**2
+
+    # Probability of leaving the region from each site in one step.
+    p_exit = 1.0 - np.asarray(q.sum(axis=1)).ravel()
+    q_t = q.T.tocsr()
+    cur_vector = np.zeros(n_sites)
+    cur_vector[start] = 1.0
+    for n_steps in range(1, max_step + 1):
+        pmf[n_steps] = cur_vector @ p_exit
+        cur_vector = q_t @ cur_vector
+
+    return mean, variance, pmf
@@ -0,0 +1,215 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Online statistics
+
+Summarizes the samples of a Toy MC as they are produced,
+chunk by chunk, so the whole sample array never has to be
+kept in memory, however many samples there are.
+
+The class `OnlineStats` keeps the number of samples, the
+mean and variance, updated with the pairwise formulas of
+Welford and Chan, the smallest and largest sample, and a
+histogram of the integer samples. Samples past the end of
+the histogram fall in an overflow bin, which is split in
+logarithmic buckets to still give approximate quantiles.
+
+Without a histogram, n_bins=None, any real samples can be
+summarized, such as importance weights or ratios.
+
+Two OnlineStats, say from two processes, merge with `+`.
+"""
+
+
+import numpy as np
+
+
+class OnlineStats:
+    """
+    Mergeable summary of non-negative integer samples,
+    or of any real samples without the histogram.
+
+    Parameters
+    ----------
+    n_bins : int or None
+        Samples 0, ..., n_bins - 1 are counted exactly.
+        Larger samples go to the overflow bin.
+        None keeps no histogram, only the moments and range.
+    buckets_per_octave : int
+        Resolution of the overflow bin, the number of log
+        buckets per doubling of the sample. Quantiles in the
+        overflow are good to about 2^(1/buckets_per_octave).
+    """
+
+    def __init__(self, n_bins=1000, buckets_per_octave=8):
+        self.n_bins = n_bins
+        self.buckets_per_octave = buckets_per_octave
+
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+        # Last entry of counts is the overflow bin.
+        self.counts = None
+        self.overflow = None
+        if n_bins is not None:
+            self.counts = np.zeros(n_bins + 1, dtype=np.int64)
+            self.overflow = np.zeros(64 * buckets_per_octave, dtype=np.int64)
+
+    def update(self, samples):
+        """
+        Add a chunk of samples.
+
+        Parameters
+        ----------
+        samples : array
+            Non-negative integer samples,
+            or any real samples if there is no histogram.
+
+        Returns
+        -------
+        self : OnlineStats
+        """
+
+        samples = np.asarray(samples).ravel()
+        if len(samples) == 0:
+            return self
+        if self.counts is not None:
+            if not (np.issubdtype(samples.dtype, np.integer)
+                    or samples.dtype == bool):
+                raise ValueError("the histogram needs integer samples, "
+                                 "use n_bins=None for real samples")
+            if np.any(samples < 0):
+                raise ValueError("samples have to be non-negative")
+
+        chunk = OnlineStats(self.n_bins, self.buckets_per_octave)
+        chunk.n = len(samples)
+        chunk.mean = np.mean(samples, dtype=float)
+        chunk.m2 = np.sum(np.square(samples - chunk.mean))
+        chunk.min = samples.min()
+        chunk.max = samples.max()
+
+        if self.counts is not None:
+            chunk.counts += np.bincount(np.minimum(samples, self.n_bins),
+                                        minlength=self.n_bins + 1)
+            large = samples[samples >= self.n_bins]
+            if len(large) > 0:
+                chunk.overflow += np.bincount(self.overflow_bucket(large),
+                                              minlength=len(self.overflow))
+
+        return self.merge(chunk)
+
+    def merge(self, other):
+        """
+        Add the samples summarized by another OnlineStats
+        with the same binning.
+
+        Parameters
+        ----------
+        other : OnlineStats
+
+        Returns
+        -------
+        self : OnlineStats
+        """
+
+        if (other.n_bins != self.n_bins
+                or other.buckets_per_octave != self.buckets_per_octave):
+            raise ValueError("can only merge OnlineStats with the same bins")
+        if other.n == 0:
+            return self
+
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta**2 * self.n * other.n / n
+        self.n = n
+
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+        if self.counts is not None:
+            self.counts += other.counts
+            self.overflow += other.overflow
+
+        return self
+
+    def __add__(self, other):
+        out = OnlineStats(self.n_bins, self.buckets_per_octave)
+        return out.merge(self).merge(other)
+
+    def overflow_bucket(self, samples):
+        """
+        Log bucket of samples in the overflow bin.
+        """
+        octaves = np.log2(np.asarray(samples, dtype=float) / self.n_bins)
+        bucket = np.floor(octaves * self.buckets_per_octave).astype(int)
+        return np.clip(bucket, 0, len(self.overflow) - 1)
+
+    def check_histogram(self):
+        """
+        Raise ValueError if no histogram is kept.
+        """
+        if self.counts is None:
+            raise ValueError("no histogram is kept with n_bins=None")
+
+    @property
+    def variance(self):
+        """
+        Variance of the samples.
+        """
+        return self.m2 / self.n if self.n > 0 else np.nan
+
+    @property
+    def std_error(self):
+        """
+        Standard error of the mean.
+        """
+        return np.sqrt(self.variance / self.n) if self.n > 0 else np.nan
+
+    @property
+    def pmf(self):
+        """
+        Fraction of samples equal to 0, ..., n_bins - 1.
+        """
+        self.check_histogram()
+        return self.counts[:-1] / self.n
+
+    def quantile(self, q):
+        """
+        Quantiles of the samples, the smallest sample with at
+        least a fraction q of the samples at or below it.
+        Exact within the histogram, approximate in the overflow.
+
+        Parameters
+        ----------
+        q : float or array
+            Fractions between 0 and 1.
+
+        Returns
+        -------
+        out : float or array
+            Quantiles.
+        """
+
+        self.check_histogram()
+        if(self.n == 0):
+            raise ValueError("no samples to take quantiles of")
+
+        q = np.asarray(q, dtype=float)
+        rank = np.maximum(np.ceil(q * self.n), 1)
+
+        cumulative = np.cumsum(self.counts[:-1])
+        out = np.searchsorted(cumulative, rank).astype(float)
+
+        # Ranks in the overflow bin, found in the log buckets.
+        over = out >= self.n_bins
+        if np.any(over):
+            cumulative = cumulative[-1] + np.cumsum(self.overflow)
+            bucket = np.searchsorted(cumulative, rank[over])
+            centre = self.n_bins * 2**((bucket + 0.5) / self.buckets_per_octave)
+            out[over] = np.clip(np.round(centre), self.n_bins, self.max)
+
+        return out[()]
@@ -16,8 +16,8 @@ If the ant starts in the middle of a box that is
 get to the food on average?
 
 I deploy a toy MC to solve this problem.
-The function `ant_walk` walks the ant until it
-reaches the wall and returns how many steps it
+The function `ant_walks` walks the ants until they
+reach the wall and returns how many steps they
 took to get there. The number of steps
 is equal to the number of seconds there.
 With this function, I produce a distribution
@@ -29,43 +29,65 @@ The answer is 4.5 seconds.
 import numpy as np
 import matplotlib.pyplot as plt
 
+from lattice_walk import exit_time, walk_until
+from online_stats import OnlineStats
 
-def ant_walk():
+
+def food(x, y):
     """
-    Randomly walks the ant until it reaches food.
-    Effectively a markov chain with a stopping condition.
+    True where the ant reached the walls of the box, 20 cm,
+    or 2 steps, from the origin.
     """
+    return (np.abs(x) == 2) | (np.abs(y) == 2)
 
-    step, x, y = 0, 0, 0
-    while(np.abs(y) != 2.0 and np.abs(x) != 2.0):
-        move_dir = np.random.choice(np.arange(4))
 
-        if(move_dir == 0):
-            x += 1.0
-        elif(move_dir == 1):
-            y += 1.0
-        elif(move_dir == 2):
-            x -= 1.0
-        elif(move_dir == 3):
-            y -= 1.0
+def ant_walks(n_ants, rng=None):
+    """
+    Randomly walks the ants until they reach food.
+    Effectively a markov chain with a stopping condition.
 
-        step += 1
-    return step
+    Parameters
+    ----------
+    n_ants : int
+        Number of ants to walk.
+    rng : numpy.random.Generator, optional
+        Random number generator.
+
+    Returns
+    -------
+    out : array
+        Number of steps each ant took.
+    """
+    return walk_until(food, n_ants, rng=rng)
 
 
 if __name__ == "__main__":
 
     nants = 100000
-    nsteps = np.array([ant_walk() for ithrow in range(nants)])
+    chunk_size = 10000
+
+    # Only a summary of the walks is kept, chunk by chunk.
+    stats = OnlineStats(n_bins=1000)
+    for start in range(0, nants, chunk_size):
+        stats.update(ant_walks(min(chunk_size, nants - start)))
 
-    mean = np.mean(nsteps)
+    mean = stats.mean
+    exact_mean, exact_variance, exact_pmf = exit_time(food)
 
     plt.figure()
-    plt.hist(nsteps,
+    # Walks longer than the histogram are only counted.
+    n_shown = int(min(stats.max, stats.n_bins))
+    plt.hist(np.arange(stats.n_bins),
+             weights=stats.counts[:-1],
              log=True,
-             range=(0.0, np.max(nsteps)),
-             bins=int(np.max(nsteps)))
+             range=(0, n_shown),
+             bins=n_shown,
+             label="Toy MC, %d walks over %d steps not shown"
+             % (stats.counts[-1], stats.n_bins - 1))
     plt.axvline(mean, color='red', label="Mean = %.2f seconds" % mean)
+    plt.step(np.arange(len(exact_pmf)), nants * exact_pmf, where='mid',
+             color='black',
+             label="Exact PMF, mean = %.2f seconds" % exact_mean)
     plt.legend()
     plt.xlabel("Number of Steps Until Wall")
     plt.xlim(0, 50)
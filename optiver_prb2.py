@@ -16,75 +16,176 @@ through (10cm, 0cm) and (0cm, 10cm) points. How long
 does it take to get to the food on average?
 
 I deploy a toy MC to solve this problem.
-The function `ant_walk` walks the ant until it
-reaches the wall and returns how many steps it
+The function `ant_walks` walks the ants until they
+reach the wall and returns how many steps they
 took to get there. The number of steps
 is equal to the number of seconds there.
 With this function, I produce a distribution
 of stop times and find the mean.
 
 The mean time is infinite. Increasing the `max_step`
-in the function `ant_walk` returns longer and longer
+in the function `ant_walks` returns longer and longer
 mean time. I am tempted to say that it converges
 since diffusion should go as 1/r^2. However,
 numerical solutions suggest the mean does not converge.
+
+Every step changes x + y by one, up or down with equal
+probability, so the ant reaches food exactly when a one
+dimensional random walk first reaches +1. The probability it
+has not after 2n - 1 steps is u_2n = C(2n, n) / 4^n, which
+falls only as 1 / sqrt(pi n), and so the mean is infinite.
+The function `first_passage_times` inverts this to draw the
+number of steps directly, without walking the ants.
 """
 
 import numpy as np
 import matplotlib.pyplot as plt
-from multiprocessing import Pool
+import scipy.special
+
+from lattice_walk import walk_until
+from parallel_mc import run_parallel
+
+
+def food(x, y):
+    """
+    True where the ant is on the line x + y = 10 cm, or 1 step.
+    """
+    return x + y == 1
 
 
-def ant_walk(max_step=1000):
+def ant_walks(n_ants, max_step=1000, rng=None):
     """
-    Randomly walks the ant until it reaches food.
+    Randomly walks the ants until they reach food.
     Effectively a markov chain with a stopping condition.
 
     Parameters
     ----------
+    n_ants : int
+        Number of ants to walk.
     max_step : int
         The maximum number of steps taken until the 
-        loop is terminated. 
+        loop is terminated. Ants that have not reached
+        food by then are reported as max_step + 1 steps.
+    rng : numpy.random.Generator, optional
+        Random number generator.
+
+    Returns
+    -------
+    out : array
+        Number of steps each ant took.
+    """
+    return walk_until(food, n_ants, max_step=max_step + 1, rng=rng)
+
+
+def survival(n):
+    """
+    Probability that the ant has not reached food after 2n - 1
+    steps, or 2n steps, u_2n = C(2n, n) / 4^n. Computed as
+    Gamma(n + 1/2) / (sqrt(pi) Gamma(n + 1)), which stays
+    accurate for large n.
+
+    Parameters
+    ----------
+    n : array
+        Number of pairs of steps.
+
+    Returns
+    -------
+    out : array
+        Survival probability u_2n.
+    """
+    return scipy.special.poch(np.asarray(n) + 1.0, -0.5) / np.sqrt(np.pi)
+
+
+def first_passage_times(n_ants, max_step=None, rng=None):
+    """
+    Draws the number of steps the ants take to reach food
+    straight from its distribution by inverting the CDF,
+    at a cost that does not depend on the number of steps.
+
+    The number of steps is T = 2n - 1 for the smallest n with
+    u_2n <= V, V uniform. Since u_2n ~ 1 / sqrt(pi (n + 1/4)),
+    n is first guessed from that and then corrected by a step.
+
+    Parameters
+    ----------
+    n_ants : int
+        Number of ants.
+    max_step : int, optional
+        As in ant_walks, ants that have not reached food after
+        max_step steps are reported as max_step + 1 steps.
+        Without it, steps are capped at 2^62 to fit in int64.
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
+
+    Returns
+    -------
+    out : array
+        Number of steps each ant took.
     """
 
-    step, x, y = 0, 0, 0
+    if rng is None:
+        rng = np.random.default_rng()
+
+    cap = 2**62 if max_step is None else max_step + 1
+    n_cap = cap // 2 + 1
+
+    # 1 - random() is in (0, 1], so u_2n <= v always has a solution.
+    v = 1.0 - rng.random(n_ants)
+    guess = np.ceil(1.0 / (np.pi * v**2) - 0.25)
+    n = np.clip(guess, 1, n_cap).astype(np.int64)
 
-    while(y + x - 1.0 != 0.0):
-        move_dir = np.random.choice(np.arange(4))
+    # The guess can be off by one either way.
+    for _ in range(2):
+        lower = (n > 1) & (survival(n - 1) <= v)
+        n[lower] -= 1
+        higher = (n < n_cap) & (survival(n) > v)
+        n[higher] += 1
 
-        if(move_dir == 0):
-            x += 1.0
-        elif(move_dir == 1):
-            y += 1.0
-        elif(move_dir == 2):
-            x -= 1.0
-        elif(move_dir == 3):
-            y -= 1.0
-        
-        step += 1
+    return np.minimum(2 * n - 1, cap)
 
-        if(step > max_step):
-            break
-        
-    return step
+
+def count_walks(n_ants, rng, max_step=1000):
+    """
+    Histogram of the number of steps of n_ants walks,
+    the aggregate that run_parallel sums over chunks.
+
+    Parameters
+    ----------
+    n_ants : int
+        Number of ants to walk.
+    rng : numpy.random.Generator
+        Random number generator.
+    max_step : int
+        As in ant_walks.
+
+    Returns
+    -------
+    out : array
+        Number of ants that took n steps,
+        for n = 0, ..., max_step + 1.
+    """
+    return np.bincount(ant_walks(n_ants, max_step=max_step, rng=rng),
+                       minlength=max_step + 2)
 
 
 if __name__ == "__main__":
     nthrows = 10000
 
-    n_cpu = 4
-    pool = Pool(n_cpu)
-    max_step = 1000
-    nsteps_max1000 = pool.map(ant_walk,
-                              max_step * np.ones(nthrows))
-    max_step = 10000
-    nsteps_max10000 = pool.map(ant_walk,
-                               max_step * np.ones(nthrows))
-    max_step = 100000
-    nsteps_max100000 = pool.map(ant_walk,
-                                max_step * np.ones(nthrows))
-    pool.close()
-
-    print("The mean after max steps of 1000: \t %.2f" % (np.mean(nsteps_max1000)))
-    print("The mean after max steps of 10000: \t %.2f" % (np.mean(nsteps_max10000)))
-    print("The mean after max steps of 100000: \t %.2f" % (np.mean(nsteps_max100000)))
+    # Fixed seed, so every run gives the same result
+    # whatever the number of processes.
+    seed = 20210101
+    chunk_size = 1000
+
+    for max_step in [1000, 10000, 100000]:
+        hist = run_parallel(count_walks, nthrows, seed=seed,
+                            chunk_size=chunk_size, args=(max_step,))
+        mean = np.sum(np.arange(len(hist)) * hist) / nthrows
+        print("The mean after max steps of %d: \t %.2f" % (max_step, mean))
+
+    # The direct sampler reaches far longer walks in no time.
+    rng = np.random.default_rng(seed)
+    for max_step in [1000, 10000, 100000, 10000000, 1000000000]:
+        nsteps = first_passage_times(nthrows, max_step=max_step, rng=rng)
+        print("The mean after max steps of %d (direct): \t %.2f"
+              % (max_step, np.mean(nsteps)))
@@ -16,8 +16,8 @@ Food is located outside the barrier:
 How long does it take to get to the food on average?
 
 I deploy a toy MC to solve this problem.
-The function `ant_walk` walks the ant until it
-reaches the wall and returns how many steps it
+The function `ant_walks` walks the ants until they
+reach the wall and returns how many steps they
 took to get there. The number of steps
 is equal to the number of seconds there.
 With this function, I produce a distribution
@@ -27,46 +27,79 @@ The answer is 14 seconds.
 """
 
 
+from functools import lru_cache
+
 import numpy as np
 import matplotlib.pyplot as plt
 
+from lattice_walk import Region, exit_time, walk_until
+from adaptive_mc import run_until_precision
+from online_stats import OnlineStats
+
 
-def ant_walk():
+def food(x, y):
     """
-    Randomly walks the ant until it reaches food.
-    Effectively a markov chain with a stopping condition.
+    True where the ant is outside the barrier, in steps of 10 cm.
     """
+    return (np.square((x - 0.25) / 3.0) + np.square((y - 0.25) / 4.0)) >= 1.0
 
-    step, x, y = 0, 0, 0
-    while((np.square((x - 0.25) / 3.0) + np.square((y - 0.25) / 4.0)) < 1.0):
-        move_dir = np.random.choice(np.arange(4))
 
-        if(move_dir == 0):
-            x += 1.0
-        elif(move_dir == 1):
-            y += 1.0
-        elif(move_dir == 2):
-            x -= 1.0
-        elif(move_dir == 3):
-            y -= 1.0
-            
-        step += 1
-    return step
+@lru_cache(maxsize=None)
+def food_region():
+    """
+    The ellipse evaluated once on the lattice, on first use,
+    so each step of the walk is a lookup.
+    """
+    return Region.from_predicate(food)
+
+
+def ant_walks(n_ants, rng=None):
+    """
+    Randomly walks the ants until they reach food.
+    Effectively a markov chain with a stopping condition.
+
+    Parameters
+    ----------
+    n_ants : int
+        Number of ants to walk.
+    rng : numpy.random.Generator, optional
+        Random number generator.
+
+    Returns
+    -------
+    out : array
+        Number of steps each ant took.
+    """
+    return walk_until(food_region(), n_ants, rng=rng)
 
 
 if __name__ == "__main__":
 
-    nants = 10000
-    nsteps = np.array([ant_walk() for ithrow in range(nants)])
+    # Walk ants until the mean is known to 0.5%,
+    # at 95% confidence, or for at most a minute.
+    stats, err = run_until_precision(ant_walks, rel_err=0.005,
+                                     time_budget=60.0,
+                                     stats=OnlineStats(n_bins=1000))
+    nants = stats.n
+    print("Mean of %d walks: %.3f +- %.3f seconds" % (nants, stats.mean, err))
 
-    mean = np.mean(nsteps)
+    mean = stats.mean
+    exact_mean, exact_variance, exact_pmf = exit_time(food_region())
 
     plt.figure()
-    plt.hist(nsteps,
+    # Walks longer than the histogram are only counted.
+    n_shown = int(min(stats.max, stats.n_bins))
+    plt.hist(np.arange(stats.n_bins),
+             weights=stats.counts[:-1],
              log=True,
-             range=(0.0, np.max(nsteps)),
-             bins=int(np.max(nsteps)))
+             range=(0, n_shown),
+             bins=n_shown,
+             label="Toy MC, %d walks over %d steps not shown"
+             % (stats.counts[-1], stats.n_bins - 1))
     plt.axvline(mean, color='red', label="Mean = %.2f seconds" % mean)
+    plt.step(np.arange(len(exact_pmf)), nants * exact_pmf, where='mid',
+             color='black',
+             label="Exact PMF, mean = %.2f seconds" % exact_mean)
     plt.legend()
     plt.xlabel("Number of Steps Until Wall")
     plt.xlim(0, 100)
@@ -0,0 +1,83 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Parallel Toy MC
+
+Runs a Toy MC in chunks of samples over a pool of processes.
+
+Every chunk gets its own random number generator, spawned
+from one numpy SeedSequence, so the streams of the workers
+are independent, and the result only depends on the seed,
+not on the number of processes or which process ran which
+chunk. Each chunk returns a compact aggregate, such as a
+histogram of counts, which are summed in chunk order.
+"""
+
+
+from multiprocessing import Pool
+
+import numpy as np
+
+
+def run_chunk(task):
+    """
+    Run one chunk of a Toy MC in a worker process.
+
+    Parameters
+    ----------
+    task : tuple
+        (simulate, n_samples, seed, args), see run_parallel.
+
+    Returns
+    -------
+    out : array
+        The aggregate returned by simulate.
+    """
+
+    simulate, n_samples, seed, args = task
+    return simulate(n_samples, np.random.default_rng(seed), *args)
+
+
+def run_parallel(simulate, n_samples, seed=None, chunk_size=10000,
+                 n_workers=None, args=()):
+    """
+    Run a Toy MC in chunks over a pool of processes
+    and sum the aggregates of the chunks.
+
+    Parameters
+    ----------
+    simulate : callable
+        simulate(n_samples, rng, *args) runs n_samples of the Toy MC
+        with the numpy Generator rng and returns their aggregate,
+        an array of the same shape for every chunk.
+        Has to be defined at the top level of a module.
+    n_samples : int
+        Total number of samples.
+    seed : int or SeedSequence, optional
+        Seed of the whole run, fresh entropy if None.
+    chunk_size : int
+        Number of samples per chunk.
+    n_workers : int, optional
+        Number of processes, os.cpu_count() if None.
+    args : tuple
+        Extra arguments passed to simulate.
+
+    Returns
+    -------
+    out : array
+        Sum of the aggregates of all chunks.
+    """
+
+    seed_seq = seed if isinstance(seed, np.random.SeedSequence) \
+        else np.random.SeedSequence(seed)
+
+    starts = range(0, n_samples, chunk_size)
+    tasks = [(simulate, min(chunk_size, n_samples - start), child, args)
+             for start, child in zip(starts, seed_seq.spawn(len(starts)))]
+
+    with Pool(n_workers) as pool:
+        total = None
+        for aggregate in pool.imap(run_chunk, tasks):
+            total = aggregate if total is None else total + aggregate
+
+    return total
@@ -14,73 +14,416 @@ expected number of total tanks produced?
 
 To answer this question, I compute the probability mass function of the
 total number of produced tanks, given the serial numbers of captured tanks.
+
+With a flat prior, the posterior of the number of tanks N, given k
+captured tanks whose largest serial number is the m-th possible one,
+is proportional to 1 / C(N, k) for N >= m. Its sums have closed forms,
+sum over N >= b of 1 / C(N, k) = k / ((k - 1) C(b - 1, k - 1)), so the
+class `TankPosterior` computes it exactly, in log space, without
+summing over N, and updates it in O(1) as tanks are captured.
 """
 
 
 import numpy as np
+import scipy.special
 import matplotlib.pyplot as plt
 
 
-def ratio_of_n_tanks(serial_numbers, n_tanks, n_throws=1000):
+# Up to this many terms, log binomials are summed term by term,
+# exact to rounding; past it, betaln is used.
+MAX_LOG_TERMS = 64
+
+# Truncated posteriors over at most this many numbers of tanks have
+# their moments summed directly, as the closed forms cancel when the
+# posterior is narrow.
+MAX_DIRECT_SUM = 1000000
+
+
+def max_serial_cdf(serial, n_tanks, k):
+    """
+    Probability that the largest serial number of k tanks
+    captured out of n_tanks is below serial,
+    C(serial, k) / C(n_tanks, k), as a product of k ratios.
+
+    Parameters
+    ----------
+    serial : array_like
+        Serial numbers.
+    n_tanks : array_like
+        Number of produced tanks, broadcast against serial.
+    k : int
+        Number of captured tanks.
+
+    Returns
+    -------
+    out : array
+        Cumulative probability.
+    """
+    serial = np.minimum(serial, n_tanks)
+    out = np.ones(np.broadcast(serial, n_tanks).shape)
+    for i in range(k):
+        out *= np.maximum(serial - i, 0) / (np.asarray(n_tanks) - i)
+    return out
+
+
+def ratio_of_n_tanks(serial_numbers, n_tanks, n_throws=1000, rng=None):
     """
     Toy MC
     Number of times captured N serial numbers
     are as small as given serial numbers
 
+    A throw matches when the largest of the captured serial
+    numbers is below the largest given one, which happens with
+    probability C(m, k) / C(n_tanks, k). The number of matches
+    out of n_throws is then binomial, and is drawn directly,
+    for all candidate n_tanks at once.
+
     Parameters
     ----------
     serial_numbers : array_like
         Serial numbers of captured tanks
-    n_tanks : int
+    n_tanks : int or array_like
         Number of produced tanks to check against
     n_throws : int
         Number of Toy MC tests. Larger the number,
-        the longer the run time and more precise the result
+        the more precise the result
+    rng : numpy.random.Generator, optional
+        Random number generator. A fresh default_rng() if None.
 
     Returns
     -------
-    out : float
+    out : float or array
         The ratio of toy MC that had captured tanks
-        with serial numbers lower than or equal to
-        the given captured serial numbers
+        with serial numbers lower than
+        the largest given captured serial number
     """
-    possible_serial_numbers = np.arange(n_tanks)
-    results = np.zeros((n_throws, len(serial_numbers)))
-    for i in np.arange(n_throws):
-        results[i] = np.random.choice(possible_serial_numbers,
-                                      size=len(serial_numbers),
-                                      replace=False)
-    num_of_captured_less = np.sum(results < np.max(serial_numbers), axis=1)
-    num_of_matches = np.sum(num_of_captured_less == len(serial_numbers))
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    prob = max_serial_cdf(np.max(serial_numbers), n_tanks,
+                          len(serial_numbers))
+    num_of_matches = rng.binomial(n_throws, prob)
 
     return num_of_matches / n_throws
 
 
+def log_binom(n, k):
+    """
+    Log of the binomial coefficient C(n, k), -inf for n < k.
+
+    Parameters
+    ----------
+    n : array_like
+        Number of items.
+    k : int
+        Number chosen.
+
+    Returns
+    -------
+    out : array
+        log C(n, k).
+    """
+    n = np.asarray(n, dtype=float)
+    valid = n >= k
+    n_valid = np.where(valid, n, k)
+    if(k <= MAX_LOG_TERMS):
+        out = np.zeros(n_valid.shape)
+        for i in range(k):
+            out += np.log((n_valid - i) / (k - i))
+    else:
+        out = -np.log(n_valid + 1) - scipy.special.betaln(n_valid - k + 1,
+                                                          k + 1)
+    return np.where(valid, out, -np.inf)
+
+
+def log_binom_ratio(a, n, k):
+    """
+    Log of C(a, k) / C(n, k), for a <= n, without the cancellation
+    of subtracting two log binomials when a and n are close.
+
+    Parameters
+    ----------
+    a : array_like
+        Smaller number of items.
+    n : array_like
+        Larger number of items.
+    k : int
+        Number chosen.
+
+    Returns
+    -------
+    out : array
+        log C(a, k) - log C(n, k).
+    """
+    a = np.asarray(a, dtype=float)
+    n = np.asarray(n, dtype=float)
+    if(k > MAX_LOG_TERMS):
+        return log_binom(a, k) - log_binom(n, k)
+    out = np.zeros(np.broadcast(a, n).shape)
+    for i in range(k):
+        out += np.log1p((a - n) / (n - i))
+    return out
+
+
+def log_tail(j, b, end=None):
+    """
+    Log of the sum of 1 / C(N, j) for N = b, ..., end,
+    with end infinite if None. For j >= 2 the sum is
+    j / (j - 1) (1 / C(b - 1, j - 1) - 1 / C(end, j - 1)),
+    for j = 1 a difference of digammas, for j = 0 a count.
+
+    Parameters
+    ----------
+    j : int
+        Number chosen.
+    b : int
+        First N, at least j.
+    end : int, optional
+        Last N.
+
+    Returns
+    -------
+    out : float
+        Log of the sum, inf if it diverges.
+    """
+    if(j >= 2):
+        out = np.log(j / (j - 1)) - log_binom(b - 1, j - 1)
+        if end is not None:
+            out += np.log(-np.expm1(log_binom_ratio(b - 1, end, j - 1)))
+        return float(out)
+    if end is None:
+        return np.inf
+    if(j == 1):
+        return np.log(scipy.special.digamma(end + 1)
+                      - scipy.special.digamma(b))
+    return np.log(end - b + 1)
+
+
+class TankPosterior:
+    """
+    Exact posterior of the number of produced tanks,
+    given the serial numbers of the captured tanks,
+    with a flat prior on the number of tanks.
+
+    Only the number of captured tanks, k, and the largest
+    serial number are kept, so capturing a tank is O(1).
+    Serial numbers of the captured tanks are assumed distinct.
+
+    Parameters
+    ----------
+    serial_numbers : array_like
+        Serial numbers of the tanks captured so far.
+    first_serial : int
+        Serial number of the first tank produced.
+    n_max : int, optional
+        Largest number of tanks allowed by the prior.
+        Without it, the posterior needs k >= 2 to be normalizable,
+        has a finite mean for k >= 3 and variance for k >= 4.
+    """
+
+    def __init__(self, serial_numbers=(), first_serial=1, n_max=None):
+        self.first_serial = first_serial
+        self.n_max = n_max
+        self.k = 0
+        self.largest = None
+        for serial in serial_numbers:
+            self.update(serial)
+
+    def update(self, serial):
+        """
+        Add a captured tank.
+
+        Parameters
+        ----------
+        serial : int
+            Its serial number.
+
+        Returns
+        -------
+        self : TankPosterior
+        """
+        self.k += 1
+        if self.largest is None or serial > self.largest:
+            self.largest = int(serial)
+        return self
+
+    @property
+    def n_min(self):
+        """
+        Smallest number of tanks that produced the largest serial number.
+        """
+        return self.largest - self.first_serial + 1
+
+    def check(self):
+        """
+        Raise ValueError when the posterior is not normalizable.
+        """
+        if(self.k == 0):
+            raise ValueError("no tank captured yet")
+        if self.n_max is None and self.k < 2:
+            raise ValueError("the posterior of a single capture needs n_max")
+
+    def log_pmf(self, n_tanks):
+        """
+        Log of the posterior probability of each number of tanks.
+
+        Parameters
+        ----------
+        n_tanks : array_like
+            Numbers of produced tanks.
+
+        Returns
+        -------
+        out : array
+            Log probability, -inf outside the allowed range.
+        """
+        self.check()
+        k, a, end = self.k, self.n_min, self.n_max
+        n_tanks = np.asarray(n_tanks)
+        allowed = n_tanks >= a
+        if end is not None:
+            allowed &= n_tanks <= end
+        n_valid = np.where(allowed, n_tanks, a)
+
+        if(k >= 2):
+            # pmf = (k - 1) / (N - k + 1) C(a - 1, k - 1) / C(N, k - 1),
+            # divided by 1 - C(a - 1, k - 1) / C(n_max, k - 1) if truncated.
+            out = (np.log((k - 1) / (n_valid - k + 1.0))
+                   + log_binom_ratio(a - 1, n_valid, k - 1))
+            if end is not None:
+                out -= np.log(-np.expm1(log_binom_ratio(a - 1, end, k - 1)))
+        else:
+            out = -np.log(n_valid) - log_tail(1, a, end)
+
+        return np.where(allowed, out, -np.inf)
+
+    def pmf(self, n_tanks):
+        """
+        Posterior probability of each number of tanks.
+        """
+        return np.exp(self.log_pmf(n_tanks))
+
+    def cmf(self, n_tanks):
+        """
+        Posterior probability of at most n_tanks tanks.
+
+        Parameters
+        ----------
+        n_tanks : array_like
+            Numbers of produced tanks.
+
+        Returns
+        -------
+        out : array
+            Cumulative probability.
+        """
+        self.check()
+        k, a, end = self.k, self.n_min, self.n_max
+        n_tanks = np.asarray(n_tanks)
+        if end is not None:
+            n_tanks = np.minimum(n_tanks, end)
+        n_valid = np.maximum(n_tanks, a)
+
+        if(k >= 2):
+            # 1 - C(a - 1, k - 1) / C(N, k - 1), over the same at n_max.
+            out = -np.expm1(log_binom_ratio(a - 1, n_valid, k - 1))
+            if end is not None:
+                out /= -np.expm1(log_binom_ratio(a - 1, end, k - 1))
+        else:
+            digamma = scipy.special.digamma
+            out = ((digamma(n_valid + 1) - digamma(a))
+                   / (digamma(end + 1) - digamma(a)))
+
+        return np.where(n_tanks >= a, out, 0.0)
+
+    def direct_moments(self):
+        """
+        Mean and variance of a truncated posterior, summed
+        over every allowed number of tanks.
+        """
+        n_tanks = np.arange(self.n_min, self.n_max + 1)
+        pmf = self.pmf(n_tanks)
+        pmf /= np.sum(pmf)
+        mean = np.sum(n_tanks * pmf)
+        return mean, np.sum(np.square(n_tanks - mean) * pmf)
+
+    def mean(self):
+        """
+        Posterior expectation value of the number of tanks.
+        """
+        self.check()
+        k, a, end = self.k, self.n_min, self.n_max
+        if end is None:
+            return (k - 1) * (a - 1) / (k - 2) if k > 2 else np.inf
+        if(end - a < MAX_DIRECT_SUM):
+            return self.direct_moments()[0]
+        if(k >= 3):
+            # Closed form, times the fraction of each sum below n_max.
+            return ((k - 1) * (a - 1) / (k - 2)
+                    * -np.expm1(log_binom_ratio(a - 2, end - 1, k - 2))
+                    / -np.expm1(log_binom_ratio(a - 1, end, k - 1)))
+        # N / C(N, k) = k / C(N - 1, k - 1).
+        return np.exp(np.log(k) + log_tail(k - 1, a - 1, end - 1)
+                      - log_tail(k, a, end))
+
+    def variance(self):
+        """
+        Posterior variance of the number of tanks.
+        """
+        self.check()
+        k, a, end = self.k, self.n_min, self.n_max
+        if end is None:
+            if(k <= 3):
+                return np.inf
+            return (k - 1) * (a - 1) * (a - k + 1) / ((k - 3) * (k - 2)**2)
+        if(end - a < MAX_DIRECT_SUM):
+            return self.direct_moments()[1]
+
+        # From the factorial moment E[N (N - 1)],
+        # with N (N - 1) / C(N, k) = k (k - 1) / C(N - 2, k - 2).
+        if(k >= 4):
+            moment = ((k - 1) * (a - 1) * (a - 2) / (k - 3)
+                      * -np.expm1(log_binom_ratio(a - 3, end - 2, k - 3))
+                      / -np.expm1(log_binom_ratio(a - 1, end, k - 1)))
+        elif(k >= 2):
+            moment = np.exp(np.log(k * (k - 1))
+                            + log_tail(k - 2, a - 2, end - 2)
+                            - log_tail(k, a, end))
+        else:
+            moment = ((end - a + 1) * (a + end - 2) / 2.0
+                      / np.exp(log_tail(1, a, end)))
+
+        mean = self.mean()
+        return moment + mean - mean**2
+
+
 if(__name__ == '__main__'):
 
     # Serial numbers from Wikipedia example, but could be random
     serial_numbers = np.array([60, 19, 40, 42])
     n_tanks = np.arange(np.max(serial_numbers), 1000)
 
-    ratio_matches = np.array([ratio_of_n_tanks(serial_numbers, n_tanks_)
-                              for n_tanks_ in n_tanks])
+    ratio_matches = ratio_of_n_tanks(serial_numbers, n_tanks,
+                                     n_throws=1000000)
     ratio_matches /= np.sum(ratio_matches)
 
-    k = len(serial_numbers)
-    N = n_tanks
-    m = np.max(serial_numbers)
-    stirling_approx_of_bayes = (k - 1) * np.power(m, float(k - 1)) * np.power(N, -float(k))
+    # A match in the Toy MC needs every serial below the largest one,
+    # so the largest serial number counts as the m-th tank.
+    posterior = TankPosterior(serial_numbers, first_serial=1,
+                              n_max=np.max(n_tanks))
+    exact_pmf = posterior.pmf(n_tanks)
 
     # The expectation values.
-    # 89.0 from German Tank Problem Wikipedia page
+    # 88.5 without an upper limit, from German Tank Problem Wikipedia page
     print("Numerical Expectation value: \t\t\t %f"
           % (np.sum(n_tanks * ratio_matches)))
     print("Analytical Bayesian Expectation value: \t\t %f"
-          % (89.0))
-    print("Analytical Bay., Stirling Approx., Exp. value: \t %f"
-          % (np.sum(n_tanks * stirling_approx_of_bayes)))
+          % (posterior.mean()))
+    print("Analytical Bayesian, no upper limit: \t\t %f"
+          % (TankPosterior(serial_numbers, first_serial=1).mean()))
 
-    residual = (ratio_matches - stirling_approx_of_bayes)
+    residual = (ratio_matches - exact_pmf)
 
     fig, axs = plt.subplots(2)
     fig.suptitle("German Tank Problem Probability Mass Function \n Numerical Result compared with Bayesian Analytical Result")
@@ -88,8 +431,8 @@ if(__name__ == '__main__'):
     axs[0].semilogy(n_tanks, ratio_matches,
                     label="Numerical Result",
                     color="red")
-    axs[0].semilogy(n_tanks, stirling_approx_of_bayes,
-                    label="Stirling Approx. of Bayesian Probability",
+    axs[0].semilogy(n_tanks, exact_pmf,
+                    label="Bayesian Probability",
                     color='blue')
     axs[0].set_ylabel(r"Probability Mass Function (PMF)")
     axs[0].set_xlim(np.min(n_tanks), np.max(n_tanks))
@@ -101,17 +444,19 @@ if(__name__ == '__main__'):
     axs[1].set_xlabel(r"$n_{tanks}$, the total number of tanks produced")
     axs[1].set_ylabel(r"Residual")
     axs[1].set_xlim(np.min(n_tanks), np.max(n_tanks))
-    axs[1].set_ylim(-0.004, 0.004)
+    axs[1].set_ylim(-0.0004, 0.0004)
     axs[1].grid()
     fig.savefig("./plots/tank_problem_pmf.png", dpi=300)
 
     # Numerical CMF (cumulative mass function) from PMF
     cmf = np.cumsum(ratio_matches) / np.cumsum(ratio_matches)[-1]
     median = n_tanks[np.argmin(np.abs(cmf - 0.5))]
+    exact_cmf = posterior.cmf(n_tanks)
 
     plt.figure()
     plt.title("German Tank Problem Culmulative Mass Function")
     plt.semilogx(n_tanks, cmf, label="CMF")
+    plt.semilogx(n_tanks, exact_cmf, label="Bayesian CMF", linestyle='--')
     plt.axvline(median, color='red', label="Median = %.2f" % median)
     plt.xlim(np.min(n_tanks), np.max(n_tanks))
     plt.grid()
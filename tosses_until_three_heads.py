@@ -18,6 +18,8 @@ of tosses until three heads.
 import numpy as np
 import matplotlib.pyplot as plt
 
+from online_stats import OnlineStats
+
 
 def tosses_until_three_heads():
     """
@@ -43,20 +45,27 @@ def tosses_until_three_heads():
 if(__name__ == '__main__'):
     # Number of Toy MC runs, or games until three heads
     nthrows = 10000
+    chunk_size = 1000
 
-    results_tosses_until_three_heads = np.array([tosses_until_three_heads()
-                                                 for i in range(nthrows)])
+    # Only a summary of the games is kept, chunk by chunk.
+    stats = OnlineStats(n_bins=1000)
+    for start in range(0, nthrows, chunk_size):
+        stats.update([tosses_until_three_heads()
+                      for i in range(min(chunk_size, nthrows - start))])
 
-    num_expectation_tosses = np.mean(results_tosses_until_three_heads)
+    num_expectation_tosses = stats.mean
 
     print('Expectation value to N: %.2f' % num_expectation_tosses)
 
-    plt.hist(results_tosses_until_three_heads,
-             range=(1, np.max(results_tosses_until_three_heads)),
-             bins=np.max(results_tosses_until_three_heads) - 1,
-             weights=np.ones(nthrows) / nthrows,
+    # Games longer than the histogram are only counted.
+    n_shown = int(min(stats.max, stats.n_bins))
+    plt.hist(np.arange(stats.n_bins),
+             range=(0, n_shown),
+             bins=n_shown,
+             weights=stats.pmf,
              log=True,
-             label='Numerical Result')
+             label=('Numerical Result, %d games over %d tosses not shown'
+                    % (stats.counts[-1], stats.n_bins - 1)))
 
     plt.axvline(14.0,
                 label='Analytical Expectation Value: %.2f' % 14,
@@ -71,7 +80,7 @@ if(__name__ == '__main__'):
 
     plt.xlabel("Number of Tosses until Three Heads")
     plt.ylabel("Probability Density Function")
-    plt.xlim(2, np.max(results_tosses_until_three_heads))
+    plt.xlim(2, n_shown)
     plt.grid()
     plt.legend()
 